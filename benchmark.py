@@ -0,0 +1,322 @@
+from midi import *
+import sys
+import os
+import io
+import json
+import struct
+import random
+import platform
+import argparse
+import tempfile
+import time
+import tracemalloc
+import shutil
+import subprocess
+import compileall
+
+# synthetic corpus profiles, notes_count is scaled by --scale
+PROFILES = {
+    'dense': dict(tracks_count=1, notes_count=50000, channels=1, controllers=2,
+                  running_status=True),
+    'many_tracks': dict(tracks_count=32, notes_count=2000, channels=16),
+    'sysex_meta': dict(tracks_count=4, notes_count=5000, channels=16, sysex_count=2000,
+                       meta_count=2000),
+    'running_status': dict(tracks_count=4, notes_count=10000, channels=4, controllers=1,
+                           running_status=True),
+}
+
+def variable_length(value):
+    bytes_repr = bytearray([value & 0b01111111])
+    value >>= 7
+
+    while value:
+        bytes_repr.insert(0, (value & 0b01111111) | 0b10000000)
+        value >>= 7
+
+    return(bytes(bytes_repr))
+
+def synthetic_track(notes_count, seed=0, channels=16, controllers=0, sysex_count=0,
+                    meta_count=0, running_status=False):
+    rng = random.Random(seed)
+    events = []
+
+    events.append((0, b'\xff\x03\x05Synth'))
+    events.append((0, b'\xff\x51\x03\x07\xa1\x20'))
+
+    tick = 0
+
+    for i in range(notes_count):
+        channel = i % channels
+        note = rng.randrange(21, 109)
+
+        tick += rng.randrange(0, 48)
+
+        for controller in range(controllers):
+            events.append((tick, bytes([0b10110000 | channel, controller + 1, rng.randrange(128)])))
+
+        events.append((tick, bytes([0b10010000 | channel, note, rng.randrange(1, 128)])))
+        events.append((tick + rng.randrange(1, 480), bytes([0b10000000 | channel, note, 64])))
+
+    for i in range(sysex_count):
+        payload = bytes(rng.randrange(128) for _ in range(rng.randrange(4, 64)))
+        events.append((rng.randrange(tick + 1), b'\xf0' + payload + b'\xf7'))
+
+    for i in range(meta_count):
+        text = ('marker %d' % i).encode('utf-8')
+        events.append((rng.randrange(tick + 1), b'\xff\x06' + variable_length(len(text)) + text))
+
+    # sorted is stable, so events at the same tick keep the order they were added
+    events.sort(key=lambda x: x[0])
+    events.append((events[-1][0], b'\xff\x2f\x00'))
+
+    track = bytearray()
+    previous_tick = 0
+    previous_status = None
+
+    for event_tick, event in events:
+        track += variable_length(event_tick - previous_tick)
+        previous_tick = event_tick
+
+        if running_status and event[0] == previous_status:
+            track += event[1:]
+        else:
+            track += event
+
+        # sysex and meta events cancel running status
+        previous_status = event[0] if event[0] < 0b11110000 else None
+
+    return(b'MTrk' + struct.pack('>I', len(track)) + bytes(track))
+
+def synthetic_file(tracks_count, notes_count, seed=0, **options):
+    midi_data = bytearray(b'MThd' + struct.pack('>IHHH', 6, 1, tracks_count, 480))
+
+    for track_index in range(tracks_count):
+        midi_data += synthetic_track(notes_count, seed + track_index, **options)
+
+    return(bytes(midi_data))
+
+def write_temporary(midi_data):
+    handle, path = tempfile.mkstemp(suffix='.mid')
+
+    with os.fdopen(handle, 'wb') as midi_file:
+        midi_file.write(midi_data)
+
+    return(path)
+
+def best_of(function, repeat=3):
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return(min(timings))
+
+def peak_memory(function):
+    tracemalloc.start()
+
+    try:
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return(result, current, peak)
+
+def bench_profile(name, options, scale=1.0, repeat=3):
+    options = dict(options)
+    options['notes_count'] = max(1, int(options['notes_count'] * scale))
+
+    midi_data = synthetic_file(seed=0, **options)
+    path = write_temporary(midi_data)
+    running_status = options.get('running_status', False)
+
+    try:
+        midi_file, retained, peak = peak_memory(lambda: MidiFile(path))
+        events_count = sum(map(lambda x: len(x.mtrk_events), midi_file.tracks))
+
+        # re-encoding has to give back the input exactly
+        roundtrip = midi_file.to_bytes(running_status) == midi_data
+
+        result = {
+            'profile': name,
+            'options': options,
+            'file_bytes': len(midi_data),
+            'events': events_count,
+            'roundtrip': roundtrip,
+            'parse_seconds': best_of(lambda: MidiFile(path), repeat),
+            'lazy_open_seconds': best_of(lambda: MidiFile(path, lazy=True), repeat),
+            'compact_seconds': best_of(lambda: CompactMidiFile.from_bytes(midi_data), repeat),
+            'summary_seconds': best_of(lambda: scan_summary(midi_data), repeat),
+            'export_seconds': best_of(lambda: midi_file.export(io.BytesIO(), running_status), repeat),
+            'retained_bytes': retained,
+            'peak_bytes': peak,
+        }
+    finally:
+        os.remove(path)
+
+    result['parse_us_per_event'] = 1e6 * result['parse_seconds'] / events_count
+    result['export_us_per_event'] = 1e6 * result['export_seconds'] / events_count
+    result['retained_bytes_per_event'] = retained / events_count
+    result['peak_bytes_per_event'] = peak / events_count
+
+    return(result)
+
+def bench_batch(files_count=64, notes_count=2000, repeat=1):
+    directory = tempfile.mkdtemp()
+    results = []
+
+    try:
+        paths = []
+
+        for i in range(files_count):
+            path = os.path.join(directory, '%d.mid' % i)
+
+            with open(path, 'wb') as midi_file:
+                midi_file.write(synthetic_file(2, notes_count, i))
+
+            paths.append(path)
+
+        for workers in sorted(set([1, 2, 4, os.cpu_count() or 1])):
+            elapsed = best_of(lambda: list(load_many(paths, 'compact', workers, 4)), repeat)
+
+            results.append({
+                'profile': 'batch',
+                'files': files_count,
+                'workers': workers,
+                'seconds': elapsed,
+                'files_per_second': files_count / elapsed,
+            })
+    finally:
+        shutil.rmtree(directory)
+
+    return(results)
+
+# runs in a fresh interpreter, so nothing is imported or cached yet
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+%s
+imported = time.perf_counter()
+MidiFile(%r)
+parsed = time.perf_counter()
+print(imported - start, parsed - imported)
+'''
+
+def bench_startup(repeat=5):
+    path = write_temporary(synthetic_file(1, 100))
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    # an installed module has current bytecode, compiling it is not measured
+    compileall.compile_file(os.path.join(directory, 'midi.py'), quiet=1)
+
+    def run(statement):
+        timings = []
+
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT % (statement, path)],
+                                    cwd=directory, capture_output=True, text=True, check=True)
+            timings.append(tuple(map(float, output.stdout.split())))
+
+        return(min(timings))
+
+    try:
+        import_seconds, first_parse_seconds = run('from midi import MidiFile')
+        star_import_seconds, _ = run('from midi import *')
+    finally:
+        os.remove(path)
+
+    return({
+        'profile': 'startup',
+        'import_seconds': import_seconds,
+        'star_import_seconds': star_import_seconds,
+        'first_parse_seconds': first_parse_seconds,
+    })
+
+def print_result(result):
+    if result['profile'] == 'startup':
+        print('%-16s import %6.2f ms  star import %6.2f ms  first parse %6.2f ms' %
+              ('startup', 1e3 * result['import_seconds'], 1e3 * result['star_import_seconds'],
+               1e3 * result['first_parse_seconds']))
+    elif result['profile'] == 'batch':
+        print('%-16s %3d workers %8.3f s %8.1f files/s' %
+              ('batch', result['workers'], result['seconds'], result['files_per_second']))
+    else:
+        print('%-16s %8d events  parse %6.2f us/event  export %6.2f us/event  '
+              '%6.1f bytes/event  roundtrip %s' %
+              (result['profile'], result['events'], result['parse_us_per_event'],
+               result['export_us_per_event'], result['retained_bytes_per_event'],
+               'ok' if result['roundtrip'] else 'FAILED'))
+
+# metrics where a higher value is a regression
+COMPARED_METRICS = ('parse_us_per_event', 'export_us_per_event', 'retained_bytes_per_event',
+                    'import_seconds', 'star_import_seconds', 'first_parse_seconds')
+
+def compare_results(results, baseline_results, tolerance):
+    baseline = dict(map(lambda x: (x['profile'], x), baseline_results))
+    regressions = []
+
+    for result in results:
+        if result['profile'] not in baseline or result['profile'] == 'batch':
+            continue
+
+        for metric in filter(lambda x: x in result, COMPARED_METRICS):
+            ratio = result[metric] / baseline[result['profile']][metric]
+
+            print('%-16s %-26s %6.2fx baseline' % (result['profile'], metric, ratio))
+
+            if ratio > 1.0 + tolerance:
+                regressions.append((result['profile'], metric, ratio))
+
+    return(regressions)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks midi.py on synthetic files')
+    parser.add_argument('profiles', nargs='*', default=sorted(PROFILES),
+                        help='profiles to run, out of: ' + ', '.join(sorted(PROFILES)))
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the notes per track')
+    parser.add_argument('--repeat', type=int, default=3, help='timings are the best of this many runs')
+    parser.add_argument('--batch', action='store_true', help='also measure load_many scaling')
+    parser.add_argument('--startup', action='store_true',
+                        help='also measure import time and first parse latency')
+    parser.add_argument('--json', help='write the results to this file as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown against --compare before failing')
+    args = parser.parse_args()
+
+    results = []
+
+    for name in args.profiles:
+        results.append(bench_profile(name, PROFILES[name], args.scale, args.repeat))
+        print_result(results[-1])
+
+    if args.startup:
+        results.append(bench_startup(max(args.repeat, 5)))
+        print_result(results[-1])
+
+    if args.batch:
+        for result in bench_batch(repeat=1):
+            results.append(result)
+            print_result(result)
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'time': time.time(),
+                'results': results,
+            }, json_file, indent=2)
+
+    failed = not all(map(lambda x: x.get('roundtrip', True), results))
+
+    if args.compare:
+        with open(args.compare) as json_file:
+            failed |= bool(compare_results(results, json.load(json_file)['results'], args.tolerance))
+
+    if failed:
+        sys.exit(1)
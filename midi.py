@@ -2,29 +2,35 @@ import sys
 import os
 import struct
 import array
+import mmap
+import bisect
+import collections
+import heapq
+import itertools
+import operator
+import time
 
-from enum import Enum
 
-def bytes_to_uint16(byte_list):
-    return struct.unpack('>H', byte_list[:4])[0]
+def bytes_to_uint16(byte_list, offset=0):
+    return struct.unpack_from('>H', byte_list, offset)[0]
 
 def uint16_to_bytes(value):
     return struct.pack('>H', value)
 
-def bytes_to_uint24(byte_list):
-    return struct.unpack('>I', b'\x00' + byte_list[:3])[0]
+def bytes_to_uint24(byte_list, offset=0):
+    return (byte_list[offset] << 16) | (byte_list[offset + 1] << 8) | byte_list[offset + 2]
 
 def uint24_to_bytes(value):
     return struct.pack('>I', value)[1:4]
 
-def bytes_to_uint32(byte_list):
-    return struct.unpack('>I', byte_list[:4])[0]
+def bytes_to_uint32(byte_list, offset=0):
+    return struct.unpack_from('>I', byte_list, offset)[0]
 
 def uint32_to_bytes(value):
     return struct.pack('>I', value)
 
-def bytes_to_str(byte_list):
-    return byte_list.decode('utf-8')
+def bytes_to_str(byte_list, errors='strict'):
+    return str(byte_list, 'utf-8', errors)
 
 def str_to_bytes(value):
     return value.encode('utf-8')
@@ -35,10 +41,10 @@ def enum_values(enum):
 def enum_names(enum):
     return list(map(lambda x: x.name, enum))
 
-def decode_variable_length_value(byte_list):
+def decode_variable_length_value(byte_list, offset=0):
     value = 0
 
-    tmp_pos = 0
+    tmp_pos = offset
 
     while byte_list[tmp_pos] & 0b10000000 != 0:
         value_part = byte_list[tmp_pos] & 0b01111111
@@ -52,490 +58,3037 @@ def decode_variable_length_value(byte_list):
 
     tmp_pos += 1
 
-    return(value, tmp_pos)
+    return(value, tmp_pos - offset)
+
+def variable_length_value_size(value):
+    size = 1
+
+    while value > 0b01111111:
+        value >>= 7
+        size += 1
+
+    return(size)
+
+def write_variable_length_value(bytes_repr, value):
+    if value < 0b10000000:
+        bytes_repr.append(value)
+
+        return
+
+    shift = 7
+
+    while value >> (shift + 7):
+        shift += 7
+
+    while shift:
+        bytes_repr.append(((value >> shift) & 0b01111111) | 0b10000000)
+        shift -= 7
+
+    bytes_repr.append(value & 0b01111111)
 
 def encode_variable_length_value(value):
     bytes_repr = bytearray()
 
-    bytes_repr.insert(0, value & 0b01111111)
-    value >>= 7
-
-    while value & 0b01111111 != 0:
-        bytes_repr.insert(0, (value & 0b01111111) | 0b10000000)
-        value >>= 7
+    write_variable_length_value(bytes_repr, value)
 
     return(bytes(bytes_repr))
 
+# accessors for the named fields of the uniform event layouts, they raise
+# AttributeError like a missing attribute when the event is of another type
+class DataField():
+    def __init__(self, slot, *event_types):
+        self.slot = slot
+        self.values = frozenset(map(int, event_types))
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return(self)
+
+        if instance.status & 0b11110000 not in self.values:
+            raise(AttributeError(self.name))
+
+        return(getattr(instance, self.slot))
+
+    def __set__(self, instance, value):
+        if instance.status & 0b11110000 not in self.values:
+            raise(AttributeError(self.name))
+
+        setattr(instance, self.slot, value)
+
+def payload_property(meta_type, decode, encode):
+    def getter(self):
+        if self.meta_type != meta_type:
+            raise(AttributeError(META_EVENT_TYPES[meta_type]))
+
+        return(decode(self.payload))
+
+    def setter(self, value):
+        if self.meta_type != meta_type:
+            raise(AttributeError(META_EVENT_TYPES[meta_type]))
+
+        self.payload = encode(value)
+
+    return(property(getter, setter))
+
 class MidiException(Exception):
-    pass
+    def __init__(self, message, offset=None, chunk_index=None, status=None):
+        super().__init__(message)
+
+        self.message = message
+        self.offset = offset
+        self.chunk_index = chunk_index
+        self.status = status
+
+    def __str__(self):
+        context = []
+
+        if self.chunk_index is not None:
+            context.append('chunk ' + str(self.chunk_index))
+
+        if self.offset is not None:
+            context.append('offset ' + str(self.offset))
+
+        if self.status is not None:
+            context.append('status 0x%02x' % self.status)
+
+        if context:
+            return(self.message + ' (' + ', '.join(context) + ')')
+        else:
+            return(self.message)
+
+def event_error(byte_list, offset, error):
+    try:
+        status = byte_list[offset + decode_variable_length_value(byte_list, offset)[1]]
+    except IndexError:
+        status = None
+
+    if isinstance(error, MidiException):
+        return(MidiException(error.message, offset, error.chunk_index, status))
+    elif isinstance(error, IndexError):
+        return(MidiException('Truncated event', offset, None, status))
+    else:
+        return(MidiException('Invalid event', offset, None, status))
+
+# offset of the next MTrk marker at or after start, or end if there is none
+def find_chunk(byte_list, start, end=None):
+    end = len(byte_list) if end is None else end
+    next_pos = bytes(byte_list[start:end]).find(b'MTrk')
+
+    return(start + next_pos if next_pos != -1 else end)
+
+# offset to continue decoding at after the broken event at offset, unknown
+# meta events still have a valid length and are skipped as a whole, otherwise
+# it is the first following offset where a complete event decodes
+def resync_event(byte_list, offset, end):
+    try:
+        status_pos = offset + decode_variable_length_value(byte_list, offset)[1]
+
+        if byte_list[status_pos] == 0b11111111:
+            payload_length, length = decode_variable_length_value(byte_list, status_pos + 2)
+            next_pos = status_pos + 2 + length + payload_length
+
+            if next_pos <= end:
+                return(next_pos)
+    except IndexError:
+        pass
+
+    for tmp_pos in range(offset + 1, end):
+        try:
+            mtrk_event = MTrkEvent(byte_list, tmp_pos)
+        except Exception:
+            continue
+
+        if tmp_pos + mtrk_event.length <= end:
+            return(tmp_pos)
+
+    return(end)
+
+def is_end_of_track(mtrk_events):
+    return(len(mtrk_events) > 0 and type(mtrk_events[-1].event) is MetaEvent and
+           mtrk_events[-1].event.meta_type == META_END_OF_TRACK)
+
+# counters and timings per phase ('read', 'chunk_scan', 'decode',
+# 'serialize'), callback(stats, phase) is called after every phase and for
+# every error, nothing is measured unless a ParseStats is passed in
+class ParseStats():
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.timings = collections.Counter()
+        self.calls = collections.Counter()
+        self.bytes_counts = collections.Counter()
+        self.event_counts = collections.Counter()
+        self.errors = []
+
+    @property
+    def events_count(self):
+        return(sum(self.event_counts.values()))
+
+    @property
+    def events_per_second(self):
+        return(self.events_count / self.timings['decode'] if self.timings['decode'] else 0.0)
+
+    def record(self, phase, seconds, bytes_count=0):
+        self.timings[phase] += seconds
+        self.calls[phase] += 1
+        self.bytes_counts[phase] += bytes_count
+
+        if self.callback is not None:
+            self.callback(self, phase)
+
+    def record_events(self, mtrk_events):
+        for mtrk_event in mtrk_events:
+            event = mtrk_event.event
+
+            if type(event) is MidiEvent:
+                self.event_counts[MIDI_EVENT_TYPES[event.status & 0b11110000]] += 1
+            elif type(event) is MetaEvent:
+                self.event_counts['meta_' + META_EVENT_TYPES[event.meta_type]] += 1
+            else:
+                self.event_counts[SYSTEM_EVENT_TYPES[event.status]] += 1
+
+    def record_error(self, error):
+        self.errors.append(error)
+
+        if self.callback is not None:
+            self.callback(self, 'error')
+
+    def report(self):
+        return({
+            'timings': dict(self.timings),
+            'calls': dict(self.calls),
+            'bytes': dict(self.bytes_counts),
+            'events': dict(self.event_counts),
+            'events_per_second': self.events_per_second,
+            'errors': list(map(str, self.errors)),
+        })
+
+    def __repr__(self):
+        return('<Parse stats ' +
+               ', '.join(map(lambda x: x + ': ' + '%.6f s' % self.timings[x], self.timings)) +
+               (', ' if self.timings else '') +
+               'Events: ' + str(self.events_count) + ', ' +
+               'Errors: ' + str(len(self.errors)) + '>')
 
 class MidiFile():
-    def __init__(self, path):
+    # with recover, broken chunks and events are skipped instead of failing
+    # the whole file and every skipped problem is kept in diagnostics, all
+    # tracks are then decoded right away
+    def __init__(self, path, lazy=False, workers=None, stats=None, recover=False):
         self.path = path
         self.chunks = []
+        self.stats = stats
+        self.diagnostics = []
+
+        self._indices = {}
+
+        if path is None:
+            return
 
         try:
+            start = time.perf_counter() if stats is not None else None
+
             with open(path, 'rb') as midi_file:
-                midi_data = midi_file.read()
+                # a single shared view, chunks and events only keep offsets into it
+                midi_data = memoryview(midi_file.read())
 
-                file_pos = 0
+            if stats is not None:
+                stats.record('read', time.perf_counter() - start, len(midi_data))
+                start = time.perf_counter()
 
-                while file_pos < len(midi_data):
-                    new_chunk = Chunk(midi_data[file_pos:])
-                    self.chunks.append(new_chunk)
+            # with stats every track is decoded separately below, so that
+            # scanning the chunks and decoding them are measured apart
+            scan_only = lazy or workers is not None or stats is not None or recover
+            file_pos = 0
 
-                    file_pos += 8 + new_chunk.length
-        except:
-            raise(MidiException('Could not open midi file'))
+            while file_pos < len(midi_data):
+                try:
+                    new_chunk = Chunk(midi_data, file_pos, scan_only, stats)
+                except MidiException as e:
+                    e.chunk_index = len(self.chunks)
+
+                    if not recover:
+                        raise
+
+                    self.diagnostics.append(e)
+                    file_pos = self.recover_chunk(midi_data, file_pos)
+
+                    continue
+
+                if recover:
+                    self.check_chunk_length(midi_data, new_chunk)
+
+                self.chunks.append(new_chunk)
+
+                file_pos += 8 + new_chunk.length
+
+            if stats is not None:
+                stats.record('chunk_scan', time.perf_counter() - start, len(midi_data))
+
+            if recover:
+                for chunk_index, chunk in enumerate(self.chunks):
+                    if chunk._chunk_type == M_TRK:
+                        diagnostics = []
+
+                        chunk.decode(diagnostics)
+
+                        for diagnostic in diagnostics:
+                            diagnostic.chunk_index = chunk_index
+
+                        self.diagnostics.extend(diagnostics)
+            elif workers is not None and not lazy:
+                start = time.perf_counter()
+
+                self.decode_parallel(workers)
+
+                if stats is not None:
+                    stats.record('decode', time.perf_counter() - start, len(midi_data))
+
+                    for chunk in self.tracks:
+                        stats.record_events(chunk.mtrk_events)
+            elif stats is not None and not lazy:
+                for chunk_index, chunk in enumerate(self.chunks):
+                    if chunk._chunk_type == M_TRK:
+                        try:
+                            chunk.decode()
+                        except MidiException as e:
+                            e.chunk_index = chunk_index
+                            raise
+        except MidiException as e:
+            error = MidiException('Could not open midi file: ' + e.message,
+                                  e.offset, e.chunk_index, e.status)
+
+            if stats is not None:
+                stats.record_error(error)
+
+            raise(error) from e
+        except Exception as e:
+            error = MidiException('Could not open midi file')
+
+            if stats is not None:
+                stats.record_error(error)
+
+            raise(error) from e
+
+    # continues after an unreadable chunk header at the next MTrk marker, the
+    # bytes in between are given to the track before if it stops there without
+    # an end of track event, as that is what a too short MTrk length looks like
+    def recover_chunk(self, midi_data, file_pos):
+        next_pos = find_chunk(midi_data, file_pos + 1)
+
+        if self.chunks:
+            chunk = self.chunks[-1]
+
+            if chunk._chunk_type == M_TRK and \
+               chunk._offset + 8 + chunk.length == file_pos and \
+               bytes(midi_data[file_pos - 3:file_pos]) != b'\xff\x2f\x00':
+                self.diagnostics.append(MidiException('Bad chunk length', chunk._offset,
+                                                      len(self.chunks) - 1))
+
+                chunk.length = next_pos - chunk._offset - 8
+
+        return(next_pos)
+
+    # shortens tracks that run past the end of the file, and tracks that run
+    # into the next track right after their end of track event
+    def check_chunk_length(self, midi_data, chunk):
+        start = chunk._offset + 8
+
+        if start + chunk.length > len(midi_data):
+            self.diagnostics.append(MidiException('Truncated chunk', chunk._offset,
+                                                  len(self.chunks)))
+
+            chunk.length = len(midi_data) - start
+
+        if chunk._chunk_type == M_TRK:
+            next_pos = find_chunk(midi_data, start, start + chunk.length)
+
+            if next_pos < start + chunk.length and \
+               bytes(midi_data[next_pos - 3:next_pos]) == b'\xff\x2f\x00':
+                self.diagnostics.append(MidiException('Bad chunk length', chunk._offset,
+                                                      len(self.chunks)))
+
+                chunk.length = next_pos - start
+
+    # decodes the undecoded tracks on a process pool, every worker maps the
+    # file itself and only sends back the compact arrays of its track
+    def decode_parallel(self, workers=None):
+        import concurrent.futures
+
+        chunks = list(filter(lambda x: x._chunk_type == M_TRK and not x.decoded,
+                             self.chunks))
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            compact_tracks = executor.map(decode_track, [self.path] * len(chunks),
+                                          list(map(lambda x: x._offset, chunks)))
+
+            for chunk in chunks:
+                try:
+                    compact_track = next(compact_tracks)
+                except MidiException as e:
+                    e.chunk_index = self.chunks.index(chunk)
+
+                    raise(e)
+
+                chunk.mtrk_events = compact_track.to_mtrk_events()
 
     def __iter__(self):
         for chunk in self.chunks:
             yield(chunk)
 
+    @classmethod
+    def from_chunks(cls, chunks, path=None):
+        midi_file = cls(None)
+        midi_file.path = path
+        midi_file.chunks = chunks
+
+        return(midi_file)
+
     def __repr__(self):
-        return('<File: ' + self.path + '>')
+        return('<File: ' + str(self.path) + '>')
 
-    def export(self, path='out.mid'):
-        with open(path, 'wb') as midi_file:
-            for chunk in self.chunks:
-                midi_file.write(chunk.to_bytes())
+    @property
+    def header(self):
+        for chunk in self.chunks:
+            if chunk._chunk_type == M_THD:
+                return(chunk)
 
+        raise(MidiException('No MThd chunk'))
 
-class ChunkType(Enum):
-    m_thd = 'MThd'
-    m_trk = 'MTrk'
+    @property
+    def tracks(self):
+        return(list(filter(lambda x: x._chunk_type == M_TRK, self.chunks)))
 
-class Chunk():
-    def __init__(self, byte_list):
-        self.chunk_type = ChunkType(bytes_to_str(byte_list[:4]))
-        self.length = bytes_to_uint32(byte_list[4:8])
-
-        if self.chunk_type == ChunkType.m_thd:
-            if self.length == 6:
-                self.file_format = bytes_to_uint16(byte_list[8:10])
-                self.tracks_count = bytes_to_uint16(byte_list[10:12])
-                self.division = bytes_to_uint16(byte_list[12:14])
-            else:
-                raise(MidiException('Invalid MThd chunk'))
-        elif self.chunk_type == ChunkType.m_trk:
-            self.mtrk_events = []
+    def free(self):
+        for chunk in self.chunks:
+            chunk.free()
 
-            tmp_pos = 8
+    # indices are rebuilt once the chunks list, the version of a chunk or the
+    # division of the header changed, tick times depend on all of them
+    def index(self, name, build):
+        key = tuple(map(lambda x: (id(x), x.version, getattr(x, 'division', None)),
+                        self.chunks))
 
-            while tmp_pos < 8 + self.length:
-                new_mtrk_event = MTrkEvent(byte_list[tmp_pos:])
+        if name not in self._indices or self._indices[name][0] != key:
+            self._indices[name] = (key, build())
 
-                self.mtrk_events.append(new_mtrk_event)
-                tmp_pos += new_mtrk_event.length
+        return(self._indices[name][1])
 
-    def __iter__(self):
-        if self.chunk_type == ChunkType.m_thd:
-            yield(None)
-        else:
-            for mtrk_event in self.mtrk_events:
-                yield(mtrk_event)
+    def invalidate(self):
+        self._indices = {}
 
-    def __repr__(self):
-        if self.chunk_type == ChunkType.m_thd:
-            return('<Chunk Type: ' + self.chunk_type.name + ', ' +
-                   'Length: ' + str(self.length) + ', ' +
-                   'File format: ' + str(self.file_format) + ', ' + 
-                   'Tracks count: ' + str(self.tracks_count) + ', ' + 
-                   'Division: ' + str(self.division) + '>')
-        elif self.chunk_type == ChunkType.m_trk:
-            return('<Chunk Type: ' + self.chunk_type.name + '. ' +
-                   'Length: ' + str(self.length) + '>')
+    @property
+    def tempo_map(self):
+        return(self.index('tempo_map', lambda: TempoMap.from_midi_file(self)))
 
-    def to_bytes(self):
-        bytes_repr = bytearray()
+    def track_ticks(self, track_index):
+        return(self.index('track_ticks', lambda: list(map(track_ticks, self.tracks)))[track_index])
 
-        bytes_repr += str_to_bytes(self.chunk_type.value);
-        bytes_repr += uint32_to_bytes(self.length);
+    @property
+    def note_index(self):
+        return(self.index('note_index', lambda: NoteIndex.from_midi_file(self)))
 
-        if self.chunk_type == ChunkType.m_thd:
-            bytes_repr += uint16_to_bytes(self.file_format)
-            bytes_repr += uint16_to_bytes(self.tracks_count)
-            bytes_repr += uint16_to_bytes(self.division)
-        elif self.chunk_type == ChunkType.m_trk:
-            for mtrk_event in self.mtrk_events:
-                bytes_repr += mtrk_event.to_bytes()
+    def notes_between(self, start, end, channel=None, pitch=None):
+        return(self.note_index.notes_between(start, end, channel, pitch))
 
-        return(bytes(bytes_repr))
+    def notes_sounding_at(self, tick, channel=None, pitch=None):
+        return(self.note_index.notes_sounding_at(tick, channel, pitch))
 
-class MTrkEvent():
-    def __init__(self, byte_list):
-        self.delta_time, self.length = decode_variable_length_value(byte_list)
+    def iter_merged(self):
+        return(merge_tracks(self.tracks))
 
-        tmp_pos = self.length
+    # the merged track shares its event objects with this file
+    def to_format_0(self):
+        header = self.header
 
-        event_code = byte_list[tmp_pos]
+        chunks = [Chunk(b'MThd' + uint32_to_bytes(6) + uint16_to_bytes(0) +
+                        uint16_to_bytes(1) + uint16_to_bytes(header.division)),
+                  Chunk.from_events(merge_mtrk_events(self.tracks))]
 
-        if (event_code & 0b11110000) in enum_values(MidiEventType):
-            self.event = MidiEvent(byte_list[tmp_pos:])
-        elif event_code in enum_values(SystemEventType):
-            self.event = SystemEvent(byte_list[tmp_pos:])
-        elif event_code == 0b11111111:
-            self.event = MetaEvent(byte_list[tmp_pos:])
+        return(MidiFile.from_chunks(chunks, self.path))
+
+    def export(self, path='out.mid', running_status=False):
+        if isinstance(path, (str, bytes, os.PathLike)):
+            with open(path, 'wb') as midi_file:
+                self.write(midi_file, running_status)
         else:
-            raise(MidiException('No such event'))
+            self.write(path, running_status)
 
-        self.length += self.event.length
+    # serializes one chunk at a time into a reused buffer
+    def write(self, midi_file, running_status=False):
+        bytes_repr = bytearray()
 
-    def __repr__(self):
-        return('<Delta time: ' + str(self.delta_time) + ', ' +
-               'Event: ' + self.event.__class__.__name__ + '>')
+        for chunk in self.chunks:
+            start = time.perf_counter() if self.stats is not None else None
 
-    def to_bytes(self):
+            chunk.write(bytes_repr, running_status)
+
+            if self.stats is not None:
+                self.stats.record('serialize', time.perf_counter() - start, len(bytes_repr))
+
+            midi_file.write(bytes_repr)
+
+            bytes_repr.clear()
+
+    def to_bytes(self, running_status=False):
         bytes_repr = bytearray()
 
-        bytes_repr += encode_variable_length_value(self.delta_time)
-        bytes_repr += self.event.to_bytes()
+        for chunk in self.chunks:
+            chunk.write(bytes_repr, running_status)
 
         return(bytes(bytes_repr))
 
-class MidiEventType(Enum):
-    note_off = 0b10000000
-    note_on = 0b10010000
-    note_pressure = 0b10100000
-    control_change = 0b10110000
-    program_change = 0b11000000
-    channel_pressure = 0b11010000
-    pitch_change = 0b11100000
+def track_ticks(chunk):
+    ticks = array.array('Q')
+    tick = 0
 
-class MidiEvent():
-    def __init__(self, byte_list):
-        try:
-            self.event_type = MidiEventType(byte_list[0] & 0b11110000)
-            self.channel_number = byte_list[0] & 0b00001111
-
-            if self.event_type == MidiEventType.note_off or \
-               self.event_type == MidiEventType.note_on:
-                self.note = byte_list[1]
-                self.velocity = byte_list[2]
-
-                self.length = 3
-            elif self.event_type == MidiEventType.note_pressure:
-                self.note = byte_list[1]
-                self.pressure = byte_list[2]
-
-                self.length = 3
-            elif self.event_type == MidiEventType.control_change:
-                self.control_number = byte_list[1]
-                self.new_value = byte_list[2]
-
-                self.length = 3
-            elif self.event_type == MidiEventType.program_change:
-                self.program_number = byte_list[1]
-
-                self.length = 2
-            elif self.event_type == MidiEventType.channel_pressure:
-                self.channel_pressure = byte_list[1]
-
-                self.length = 2
-            elif self.event_type == MidiEventType.pitch_change:
-                self.bottom = byte_list[1]
-                self.next_value = byte_list[2]
-
-                self.length = 3
-        except ValueError:
-            raise(MidiException('No such midi event type'))
+    for mtrk_event in chunk.mtrk_events:
+        tick += mtrk_event.delta_time
+        ticks.append(tick)
+
+    return(ticks)
+
+class TempoMap():
+    def __init__(self, division, tempo_changes=()):
+        self.division = division
+        self.ticks = array.array('Q', [0])
+        self.tempos = array.array('I', [500000])
+        self.seconds = array.array('d', [0.0])
+
+        if division & 0b1000000000000000:
+            # SMPTE timing, the upper byte is the negative frame rate and
+            # tempo changes do not affect the length of a tick
+            frames_per_second = 256 - (division >> 8)
+
+            if frames_per_second == 29:
+                frames_per_second = 29.97
+
+            self.seconds_per_unit = 1.0 / (frames_per_second * (division & 0b11111111))
+            self.tempos[0] = 1
+
+            return
+
+        self.seconds_per_unit = 1.0 / (1000000.0 * division)
+
+        for tick, tempo in sorted(tempo_changes, key=lambda x: x[0]):
+            if tick == self.ticks[-1]:
+                self.tempos[-1] = tempo
+            else:
+                self.seconds.append(self.tick_to_seconds(tick))
+                self.ticks.append(tick)
+                self.tempos.append(tempo)
+
+    @classmethod
+    def from_midi_file(cls, midi_file):
+        tempo_changes = []
+
+        for chunk in midi_file.tracks:
+            tick = 0
+
+            for mtrk_event in chunk.mtrk_events:
+                tick += mtrk_event.delta_time
+
+                if type(mtrk_event.event) is MetaEvent and \
+                   mtrk_event.event.meta_type == META_TEMPO:
+                    tempo_changes.append((tick, mtrk_event.event.tempo))
+
+        return(cls(midi_file.header.division, tempo_changes))
+
+    @classmethod
+    def from_compact(cls, compact_midi_file):
+        tempo_changes = []
+
+        for track in compact_midi_file.tracks:
+            for i in range(len(track)):
+                if track.statuses[i] == 0b11111111 and track.data1[i] == META_TEMPO:
+                    payload = track.payload(i)
+
+                    if len(payload) == 3:
+                        tempo_changes.append((track.ticks[i], bytes_to_uint24(payload)))
+
+        return(cls(compact_midi_file.division, tempo_changes))
 
     def __repr__(self):
-        if self.event_type == MidiEventType.note_off or \
-           self.event_type == MidiEventType.note_on:
-            return('<Midi event type: ' + self.event_type.name + ', ' +
-                   'Channel number: ' + str(self.channel_number) + ', ' +
-                   'Note number: ' + str(self.note) + ', ' +
-                   'Velocity: ' + str(self.velocity) + '>')
-        elif self.event_type == MidiEventType.note_pressure:
-            return('<Midi event type: ' + self.event_type.name + ', ' +
-                   'Channel number: ' + str(self.channel_number) + ', ' +
-                   'Note number: ' + str(self.note) + ', ' +
-                   'Pressure: ' + str(self.pressure) + '>')
-        elif self.event_type == MidiEventType.control_change:
-            return('<Midi event type: ' + self.event_type.name + '. ' +
-                   'Channel number: ' + str(self.channel_number) + ', ' +
-                   'Controller number: ' + str(self.control_number) + ', ' +
-                   'New Value: ' + str(self.new_value) + '>')
-        elif self.event_type == MidiEventType.program_change:
-            return('<Midi event type: ' + self.event_type.name + ', ' +
-                   'Channel number: ' + str(self.channel_number) + ', ' +
-                   'New program number: ' + str(self.program_number) + '>')
-        elif self.event_type == MidiEventType.channel_pressure:
-            return('<Midi event type: ' + self.event_type.name + ', ' +
-                   'Channel number: ' + str(self.channel_number) + ', ' +
-                   'Pressure: ' + str(self.channel_pressure) + '>')
-        elif self.event_type == MidiEventType.pitch_change:
-            return('<Midi event type: ' + self.event_type.name + ', ' +
-                   'Channel: ' + str(self.channel_number) + ', ' +
-                   'Bottom: ' + str(self.bottom) + ', ' +
-                   'Next Value: ' + str(self.next_value) + '>')
+        return('<Tempo map Division: ' + str(self.division) + ', ' +
+               'Tempo changes: ' + str(len(self.ticks)) + '>')
 
-    def to_bytes(self):
-        bytes_repr = bytearray()
+    def tempo_at(self, tick):
+        return(self.tempos[bisect.bisect_right(self.ticks, tick) - 1])
 
-        bytes_repr.append(self.event_type.value | self.channel_number)
-
-        if self.event_type == MidiEventType.note_off or \
-           self.event_type == MidiEventType.note_on:
-            bytes_repr.append(self.note)
-            bytes_repr.append(self.velocity)
-        elif self.event_type == MidiEventType.note_pressure:
-            bytes_repr.append(self.note)
-            bytes_repr.append(self.pressure)
-        elif self.event_type == MidiEventType.control_change:
-            bytes_repr.append(self.control_number)
-            bytes_repr.append(self.new_value)
-        elif self.event_type == MidiEventType.program_change:
-            bytes_repr.append(self.program_number)
-        elif self.event_type == MidiEventType.channel_pressure:
-            bytes_repr.append(self.channel_pressure)
-        elif self.event_type == MidiEventType.pitch_change:
-            bytes_repr.append(self.bottom)
-            bytes_repr.append(self.next_value)
+    def tick_to_seconds(self, tick):
+        i = bisect.bisect_right(self.ticks, tick) - 1
 
-        return(bytes(bytes_repr))
+        return(self.seconds[i] + (tick - self.ticks[i]) * self.tempos[i] * self.seconds_per_unit)
 
-class SystemEventType(Enum):
-    exclusive = 0b11110000
-    common_song_position = 0b11110010
-    common_song_select = 0b11110011
-    common_tune_request = 0b11110110
-    common = 0b11110111
-    real_time_timing_clock = 0b11111000
-    real_time_start = 0b11111010
-    real_time_continue = 0b11111011
-    real_time_stop = 0b11111100
-    real_time_active_sensing = 0b11111110
+    # the result is fractional when the time falls between two ticks
+    def seconds_to_tick(self, seconds):
+        i = max(bisect.bisect_right(self.seconds, seconds) - 1, 0)
 
-class SystemEvent():
-    def __init__(self, byte_list):
-        try:
-            self.event_type = SystemEventType(byte_list[0])
-
-            if self.event_type == SystemEventType.exclusive or \
-               self.event_type == SystemEventType.common:
-                self.length = 2
-
-                tmp_pos = 1
-
-                while byte_list[tmp_pos] != SystemEventType.common.value:
-                    tmp_pos += 1
-                    self.length += 1
-
-                self.payload = byte_list[1:self.length - 1]
-            elif self.event_type == SystemEventType.common_song_position:
-                self.length = 3
-            elif self.event_type == SystemEventType.common_song_select:
-                self.length = 2
-            elif self.event_type == SystemEventType.common_tune_request:
-                self.length = 1
-            elif self.event_type == SystemEventType.real_time_timing_clock:
-                self.length = 1
-            elif self.event_type == SystemEventType.real_time_start:
-                self.length = 1
-            elif self.event_type == SystemEventType.real_time_continue:
-                self.length = 1
-            elif self.event_type == SystemEventType.real_time_stop:
-                self.length = 1
-            elif self.event_type == SystemEventType.real_time_active_sensing:
-                self.length = 1
-            elif self.event_type == SystemEventType.real_time_reset:
-                self.length = 1
-
-        except ValueError:
-            raise(MidiException('No such system event type'))
+        return(self.ticks[i] + (seconds - self.seconds[i]) / (self.tempos[i] * self.seconds_per_unit))
+
+    def ticks_to_seconds(self, ticks):
+        return(array.array('d', map(self.tick_to_seconds, ticks)))
+
+def iter_track(chunk, track_index=0):
+    tick = 0
+
+    for mtrk_event in chunk.mtrk_events:
+        tick += mtrk_event.delta_time
+
+        yield((tick, track_index, mtrk_event))
+
+# heapq.merge is stable, so events at the same tick keep the track order
+def merge_tracks(chunks):
+    return(heapq.merge(*map(iter_track, chunks, itertools.count()), key=operator.itemgetter(0)))
+
+def merge_mtrk_events(chunks):
+    mtrk_events = []
+    tick = 0
+    end_tick = 0
+
+    for event_tick, track_index, mtrk_event in merge_tracks(chunks):
+        end_tick = event_tick
+
+        if type(mtrk_event.event) is MetaEvent and \
+           mtrk_event.event.meta_type == META_END_OF_TRACK:
+            continue
+
+        mtrk_events.append(MTrkEvent.from_values(event_tick - tick, mtrk_event.event))
+        tick = event_tick
+
+    # a single end of track, placed at the end of the longest track
+    end_of_track = MetaEvent.from_values(META_END_OF_TRACK)
+    mtrk_events.append(MTrkEvent.from_values(end_tick - tick, end_of_track))
+
+    return(mtrk_events)
+
+class PlayerStats():
+    def __init__(self, late_threshold=0.001):
+        self.late_threshold = late_threshold
+        self.events_count = 0
+        self.late_count = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    @property
+    def mean_jitter(self):
+        return(self.total_jitter / self.events_count if self.events_count else 0.0)
+
+    def record(self, jitter):
+        self.events_count += 1
+        self.total_jitter += jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+
+        if jitter > self.late_threshold:
+            self.late_count += 1
 
     def __repr__(self):
-        if self.event_type == SystemEventType.exclusive or \
-           self.event_type == SystemEventType.common:
-            return('<System event type: ' + self.event_type.name + ', ' +
-                   'Payload: ' + str(self.payload) + '>')
-        else:
-            return('<System event type: ' + self.event_type.name + '>')
+        return('<Player stats Events: ' + str(self.events_count) + ', ' +
+               'Late: ' + str(self.late_count) + ', ' +
+               'Mean jitter: ' + '%.6f' % self.mean_jitter + ', ' +
+               'Max jitter: ' + '%.6f' % self.max_jitter + '>')
 
-    def to_bytes(self):
-        bytes_repr = bytearray()
+# sends the midi and system events of a file to output(event) at their wall
+# clock time, sleeping until shortly before an event and spinning on the
+# monotonic clock for the last spin_window seconds
+class Player():
+    def __init__(self, midi_file, output, spin_window=0.002, late_threshold=0.001):
+        self.midi_file = midi_file
+        self.output = output
+        self.spin_window = spin_window
+        self.stats = PlayerStats(late_threshold)
 
-        bytes_repr.append(self.event_type.value)
-
-        if self.event_type == SystemEventType.exclusive or \
-           self.event_type == SystemEventType.common:
-            bytes_repr += self.payload
-            bytes_repr.append(SystemEventType.common.value)
-        elif self.event_type == SystemEventType.common_song_position:
-            # todo
-            bytes_repr.append(0)
-            bytes_repr.append(0)
-        elif self.event_type == SystemEventType.common_song_select:
-            # todo
-            bytes_repr.append(0)
-        elif self.event_type == SystemEventType.common_tune_request:
-            pass
-        elif self.event_type == SystemEventType.real_time_timing_clock:
-            pass
-        elif self.event_type == SystemEventType.real_time_start:
-            pass
-        elif self.event_type == SystemEventType.real_time_continue:
-            pass
-        elif self.event_type == SystemEventType.real_time_stop:
-            pass
-        elif self.event_type == SystemEventType.real_time_active_sensing:
-            pass
-        elif self.event_type == SystemEventType.real_time_reset:
-            pass
+        import threading
 
-        return(bytes(bytes_repr))
+        self._stopped = threading.Event()
+        self._thread = None
 
-class MetaEventType(Enum):
-    sequence_number = 0b00000000
-    text = 0b00000001
-    copyright_notice = 0b00000010
-    text_sequence_or_track_name = 0b00000011
-    instrument_name = 0b00000100
-    lyric = 0b00000101
-    marker = 0b0000110
-    cue_point = 0b00000111
-    channel_prefix = 0b00100000
-    end_of_track = 0b00101111
-    tempo = 0b01010001
-    smpte_offset = 0b01010100
-    time_signature = 0b01011000
-    key_signature = 0b01011001
-    sequencer_specific_payload = 0b01111111
+    def schedule(self):
+        tempo_map = self.midi_file.tempo_map
 
-class MetaEvent():
-    def __init__(self, byte_list):
-        if byte_list[0] == 0b11111111:
-            try:
-                self.event_type = MetaEventType(byte_list[1])
-                self.payload_length, self.length = decode_variable_length_value(byte_list[2:])
-
-                tmp_pos = 2 + self.length
-
-                payload = byte_list[tmp_pos:tmp_pos + self.payload_length]
-
-                if self.event_type == MetaEventType.sequence_number:
-                    self.sequence_number = bytes_to_uint16(payload)
-                elif self.event_type == MetaEventType.text:
-                    self.text = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.copyright_notice:
-                    self.copyright_notice = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.text_sequence_or_track_name:
-                    self.text_sequence_or_track_name = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.instrument_name:
-                    self.instrument_name = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.lyric:
-                    self.lyric = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.marker:
-                    self.marker = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.cue_point:
-                    self.cue_point = bytes_to_str(payload)
-                elif self.event_type == MetaEventType.channel_prefix:
-                    self.channel_prefix = payload[0]
-                elif self.event_type == MetaEventType.end_of_track:
-                    pass
-                elif self.event_type == MetaEventType.tempo:
-                    self.tempo = bytes_to_uint24(payload)
-                elif self.event_type == MetaEventType.smpte_offset:
-                    self.smpte_offset = payload
-                elif self.event_type == MetaEventType.time_signature:
-                    self.time_signature = payload
-                elif self.event_type == MetaEventType.key_signature:
-                    self.key_signature = payload
-                elif self.event_type == MetaEventType.sequencer_specific_payload:
-                    self.sequencer_specific_payload = payload
-
-                self.length += 2 + self.payload_length
-            except:
-                raise(MidiException('No such meta event'))
-        else:
-            raise(MidiException('Not a meta event'))
+        for tick, track_index, mtrk_event in self.midi_file.iter_merged():
+            if type(mtrk_event.event) is not MetaEvent:
+                yield((tempo_map.tick_to_seconds(tick), mtrk_event.event))
+
+    def dispatch(self, target, event):
+        now = time.perf_counter()
+
+        self.output(event)
+        self.stats.record(now - target)
+
+    def play(self):
+        self._stopped.clear()
+        self.stats = PlayerStats(self.stats.late_threshold)
+
+        start = time.perf_counter()
+
+        for seconds, event in self.schedule():
+            target = start + seconds
+            remaining = target - time.perf_counter()
+
+            if remaining > self.spin_window:
+                # waiting on the event keeps stop() responsive during long pauses
+                if self._stopped.wait(remaining - self.spin_window):
+                    break
+
+            while time.perf_counter() < target:
+                pass
+
+            if self._stopped.is_set():
+                break
+
+            self.dispatch(target, event)
+
+        return(self.stats)
+
+    # the spinning phase blocks the event loop for at most spin_window seconds
+    async def play_async(self):
+        self._stopped.clear()
+        self.stats = PlayerStats(self.stats.late_threshold)
+
+        start = time.perf_counter()
+
+        for seconds, event in self.schedule():
+            target = start + seconds
+            remaining = target - time.perf_counter()
+
+            if remaining > self.spin_window:
+                import asyncio
+
+                await asyncio.sleep(remaining - self.spin_window)
+
+            while time.perf_counter() < target:
+                pass
+
+            if self._stopped.is_set():
+                break
+
+            self.dispatch(target, event)
+
+        return(self.stats)
+
+    def start(self):
+        import threading
+
+        self._thread = threading.Thread(target=self.play, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        import threading
+
+        self._stopped.set()
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+        self._thread = None
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class Note():
+    __slots__ = ('start', 'end', 'channel', 'pitch', 'velocity', 'track')
+
+    def __init__(self, start, end, channel, pitch, velocity, track=0):
+        self.start = start
+        self.end = end
+        self.channel = channel
+        self.pitch = pitch
+        self.velocity = velocity
+        self.track = track
 
     def __repr__(self):
-        if self.event_type == MetaEventType.sequence_number:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Sequence number: ' + str(self.sequence_number) + '>')
-        elif self.event_type == MetaEventType.text:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Text: ' + self.text + '>')
-        elif self.event_type == MetaEventType.copyright_notice:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Copyright notice: ' + self.copyright_notice + '>')
-        elif self.event_type == MetaEventType.text_sequence_or_track_name:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Text sequence or track name: ' + self.text_sequence_or_track_name + '>')
-        elif self.event_type == MetaEventType.instrument_name:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Instrument name: ' + self.instrument_name + '>')
-        elif self.event_type == MetaEventType.lyric:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Lyric: ' + self.lyric + '>')
-        elif self.event_type == MetaEventType.marker:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Marker: ' + self.marker + '>')
-        elif self.event_type == MetaEventType.cue_point:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Cue point: ' + self.cue_point + '>')
-        elif self.event_type == MetaEventType.channel_prefix:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Channel prefix: ' + str(self.channel_prefix) + '>')
-        elif self.event_type == MetaEventType.end_of_track:
-            return('<Meta event type: ' + self.event_type.name + '>')
-        elif self.event_type == MetaEventType.tempo:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Tempo: ' + str(self.tempo) + '>')
-        elif self.event_type == MetaEventType.smpte_offset:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'SMPTE offset: ' + str(self.smpte_offset) + '>')
-        elif self.event_type == MetaEventType.time_signature:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Time signature: ' + str(self.time_signature) + '>')
-        elif self.event_type == MetaEventType.key_signature:
-            return('<Meta event type: ' + self.event_type.name + ', ' + 
-                   'Key signature: ' + str(self.key_signature) + '>')
-        elif self.event_type == MetaEventType.sequencer_specific_payload:
-            return('<Meta event type: ' + self.event_type.name + ', ' +
-                   'Sequencer specific payload: ' + str(self.sequencer_specific_payload) + '>')
+        return('<Note Start: ' + str(self.start) + ', ' +
+               'End: ' + str(self.end) + ', ' +
+               'Channel: ' + str(self.channel) + ', ' +
+               'Pitch: ' + str(self.pitch) + ', ' +
+               'Velocity: ' + str(self.velocity) + '>')
+
+# node of a centered interval tree, it holds every note containing its center
+class NoteIndexNode():
+    __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+    def __init__(self, notes):
+        starts = sorted(map(lambda x: x.start, notes))
+        self.center = starts[len(starts) // 2]
+
+        inner = []
+        left = []
+        right = []
+
+        for note in notes:
+            if note_end(note) <= self.center:
+                left.append(note)
+            elif note.start > self.center:
+                right.append(note)
+            else:
+                inner.append(note)
 
-    def to_bytes(self):
-        bytes_repr = bytearray()
+        self.by_start = sorted(inner, key=lambda x: x.start)
+        self.by_end = sorted(inner, key=note_end, reverse=True)
+        self.left = NoteIndexNode(left) if left else None
+        self.right = NoteIndexNode(right) if right else None
 
-        bytes_repr.append(0b11111111)
-        bytes_repr.append(self.event_type.value)
-        bytes_repr += encode_variable_length_value(self.payload_length)
-
-        if self.event_type == MetaEventType.sequence_number:
-            bytes_repr += uint16_to_bytes(self.sequence_number)
-        elif self.event_type == MetaEventType.text:
-            bytes_repr += str_to_bytes(self.text)
-        elif self.event_type == MetaEventType.copyright_notice:
-            bytes_repr += str_to_bytes(self.copyright_noticed)
-        elif self.event_type == MetaEventType.text_sequence_or_track_name:
-            bytes_repr += str_to_bytes(self.text_sequence_or_track_name)
-        elif self.event_type == MetaEventType.instrument_name:
-            bytes_repr += str_to_bytes(self.instrument_name)
-        elif self.event_type == MetaEventType.lyric:
-            bytes_repr += str_to_bytes(self.lyric)
-        elif self.event_type == MetaEventType.marker:
-            bytes_repr += str_to_bytes(self.marker)
-        elif self.event_type == MetaEventType.cue_point:
-            bytes_repr += str_to_bytes(self.cue_point)
-        elif self.event_type == MetaEventType.channel_prefix:
-            # this is not looking too safe
-            bytes_repr.append(self.channel_prefix)
-        elif self.event_type == MetaEventType.end_of_track:
-            pass
-        elif self.event_type == MetaEventType.tempo:
-            bytes_repr += uint24_to_bytes(self.tempo)
-        elif self.event_type == MetaEventType.smpte_offset:
-            bytes_repr += self.smpte_offset
-        elif self.event_type == MetaEventType.time_signature:
-            bytes_repr += self.time_signature
-        elif self.event_type == MetaEventType.key_signature:
-            bytes_repr += self.key_signature
-        elif self.event_type == MetaEventType.sequencer_specific_payload:
-            bytes_repr += self.sequencer_specific_payload
+# zero length notes are treated as lasting one tick so they can be found
+def note_end(note):
+    return(max(note.end, note.start + 1))
 
-        return(bytes(bytes_repr))
+class NoteIndex():
+    def __init__(self, notes):
+        self.notes = sorted(notes, key=lambda x: (x.start, x.pitch))
+        self.root = NoteIndexNode(self.notes) if self.notes else None
+
+    @classmethod
+    def from_midi_file(cls, midi_file):
+        notes = []
+
+        for track_index, chunk in enumerate(midi_file.tracks):
+            notes += pair_notes(chunk.mtrk_events, track_index)
+
+        return(cls(notes))
+
+    def __len__(self):
+        return(len(self.notes))
+
+    def __iter__(self):
+        for note in self.notes:
+            yield(note)
+
+    def __repr__(self):
+        return('<Note index Notes: ' + str(len(self.notes)) + '>')
+
+    def notes_sounding_at(self, tick, channel=None, pitch=None):
+        found = []
+        node = self.root
+
+        while node is not None:
+            if tick < node.center:
+                for note in node.by_start:
+                    if note.start > tick:
+                        break
+
+                    found.append(note)
+
+                node = node.left
+            else:
+                for note in node.by_end:
+                    if note_end(note) <= tick:
+                        break
+
+                    found.append(note)
+
+                node = node.right
+
+        return(filter_notes(found, channel, pitch))
+
+    def notes_between(self, start, end, channel=None, pitch=None):
+        found = []
+        nodes = [self.root] if self.root is not None else []
+
+        while nodes:
+            node = nodes.pop()
+
+            if end <= node.center:
+                for note in node.by_start:
+                    if note.start >= end:
+                        break
+
+                    found.append(note)
+
+                if node.left is not None:
+                    nodes.append(node.left)
+            elif start > node.center:
+                for note in node.by_end:
+                    if note_end(note) <= start:
+                        break
+
+                    found.append(note)
+
+                if node.right is not None:
+                    nodes.append(node.right)
+            else:
+                found += node.by_start
+
+                if node.left is not None:
+                    nodes.append(node.left)
+
+                if node.right is not None:
+                    nodes.append(node.right)
+
+        return(filter_notes(found, channel, pitch))
+
+def filter_notes(notes, channel=None, pitch=None):
+    if channel is not None:
+        notes = filter(lambda x: x.channel == channel, notes)
+
+    if pitch is not None:
+        notes = filter(lambda x: x.pitch == pitch, notes)
+
+    return(sorted(notes, key=lambda x: (x.start, x.pitch)))
+
+# pairs each note on with the oldest open note on of the same channel and
+# pitch, notes still open at the end of the track end with its last event
+def pair_notes(mtrk_events, track_index=0):
+    notes = []
+    open_notes = {}
+    tick = 0
+
+    for mtrk_event in mtrk_events:
+        tick += mtrk_event.delta_time
+        event = mtrk_event.event
+
+        if type(event) is not MidiEvent:
+            continue
+
+        event_type = event.status & 0b11110000
+
+        if event_type == NOTE_ON and event.data2 != 0:
+            key = (event.status & 0b00001111, event.data1)
+            open_notes.setdefault(key, collections.deque()).append((tick, event.data2))
+        elif event_type == NOTE_OFF or event_type == NOTE_ON:
+            key = (event.status & 0b00001111, event.data1)
+
+            if open_notes.get(key):
+                start, velocity = open_notes[key].popleft()
+                notes.append(Note(start, tick, key[0], key[1], velocity, track_index))
+
+    for key, starts in open_notes.items():
+        for start, velocity in starts:
+            notes.append(Note(start, tick, key[0], key[1], velocity, track_index))
+
+    return(notes)
+
+def decode_track(path, offset):
+    with open(path, 'rb') as midi_file:
+        with mmap.mmap(midi_file.fileno(), 0, access=mmap.ACCESS_READ) as midi_data:
+            return(CompactTrack.from_bytes(midi_data, offset))
+
+def read_exactly(midi_file, count):
+    byte_list = midi_file.read(count)
+
+    # pipes and sockets may return less than requested before the end
+    while 0 < len(byte_list) < count:
+        byte_list_part = midi_file.read(count - len(byte_list))
+
+        if not byte_list_part:
+            break
+
+        byte_list += byte_list_part
+
+    return(byte_list)
+
+def iter_events(path_or_file, block_size=65536):
+    if isinstance(path_or_file, (str, bytes, os.PathLike)):
+        with open(path_or_file, 'rb') as midi_file:
+            yield from _iter_file_events(midi_file, block_size)
+    else:
+        yield from _iter_file_events(path_or_file, block_size)
+
+def _iter_file_events(midi_file, block_size):
+    track_index = 0
+
+    while True:
+        header = read_exactly(midi_file, 8)
+
+        if not header:
+            return
+
+        if len(header) < 8:
+            raise(MidiException('Truncated chunk header'))
+
+        chunk_type = bytes_to_str(header[:4], 'replace')
+
+        if chunk_type not in CHUNK_TYPES:
+            raise(MidiException('No such chunk type'))
+
+        remaining = bytes_to_uint32(header, 4)
+
+        if chunk_type != M_TRK:
+            while remaining:
+                skipped = read_exactly(midi_file, min(block_size, remaining))
+
+                if not skipped:
+                    raise(MidiException('Truncated chunk'))
+
+                remaining -= len(skipped)
+
+            continue
+
+        byte_list = b''
+        tmp_pos = 0
+        running_status = None
+
+        while tmp_pos < len(byte_list) or remaining:
+            try:
+                new_mtrk_event = MTrkEvent(byte_list, tmp_pos, running_status)
+                complete = tmp_pos + new_mtrk_event.length <= len(byte_list)
+            except (IndexError, MidiException):
+                if not remaining:
+                    raise
+
+                complete = False
+
+            if not complete:
+                if not remaining:
+                    raise(MidiException('Truncated MTrk event'))
+
+                # keep only the unfinished event and append the next block
+                block = read_exactly(midi_file, min(block_size, remaining))
+
+                if not block:
+                    raise(MidiException('Truncated chunk'))
+
+                byte_list = byte_list[tmp_pos:] + block
+                tmp_pos = 0
+                remaining -= len(block)
+
+                continue
+
+            tmp_pos += new_mtrk_event.length
+            running_status = new_mtrk_event.running_status
+
+            yield((track_index, new_mtrk_event))
+
+        track_index += 1
+
+
+M_THD = 'MThd'
+M_TRK = 'MTrk'
+
+# value -> name, ChunkType and the other Enum classes are only built from
+# these tables when they are first asked for, see enum_type
+CHUNK_TYPES = {
+    M_THD: 'm_thd',
+    M_TRK: 'm_trk',
+}
+
+# the events of a chunk, any change to the list itself bumps its version,
+# which is part of the version of its chunk, edits of the event objects
+# themselves are not noticed and need a call to chunk.changed()
+class EventList(list):
+    # a plain counter instead of a reference back to the chunk, so chunks and
+    # their events do not form a cycle that only the garbage collector frees
+    version = 0
+
+def event_list_method(name):
+    method = getattr(list, name)
+
+    def changing_method(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+
+        self.version += 1
+
+        return(result)
+
+    changing_method.__name__ = name
+
+    return(changing_method)
+
+for method_name in ('append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse',
+                    '__setitem__', '__delitem__', '__iadd__', '__imul__'):
+    setattr(EventList, method_name, event_list_method(method_name))
+
+# loop variables would otherwise end up in star imports and __all__
+del method_name
+
+class Chunk():
+    def __init__(self, byte_list, offset=0, lazy=False, stats=None):
+        # kept as the plain string, chunk_type builds the ChunkType member
+        self._chunk_type = bytes_to_str(byte_list[offset:offset + 4], 'replace')
+
+        if self._chunk_type not in CHUNK_TYPES or len(byte_list) < offset + 8:
+            raise(MidiException('No such chunk type', offset))
+
+        self.length = bytes_to_uint32(byte_list, offset + 4)
+
+        self.stats = stats
+
+        self._byte_list = None
+        self._offset = offset
+        self._mtrk_events = None
+
+        # bumped whenever the events are replaced or freed, indices built from
+        # them compare the version property
+        self._version = 0
+
+        if self._chunk_type == M_THD:
+            if offset + 8 + self.length > len(byte_list):
+                raise(MidiException('Truncated chunk', offset))
+            elif self.length == 6:
+                self.file_format = bytes_to_uint16(byte_list, offset + 8)
+                self.tracks_count = bytes_to_uint16(byte_list, offset + 10)
+                self.division = bytes_to_uint16(byte_list, offset + 12)
+            else:
+                raise(MidiException('Invalid MThd chunk', offset))
+        elif self._chunk_type == M_TRK:
+            self._byte_list = byte_list
+
+            if not lazy:
+                self.decode()
+
+    @classmethod
+    def from_events(cls, mtrk_events):
+        chunk = cls.__new__(cls)
+        chunk._chunk_type = M_TRK
+        chunk.length = sum(map(lambda x: x.length, mtrk_events))
+
+        chunk.stats = None
+
+        chunk._byte_list = None
+        chunk._offset = 0
+        chunk._mtrk_events = EventList(mtrk_events)
+
+        chunk._version = 0
+
+        return(chunk)
+
+    @property
+    def chunk_type(self):
+        return(enum_type('ChunkType')(self._chunk_type))
+
+    @chunk_type.setter
+    def chunk_type(self, chunk_type):
+        self._chunk_type = getattr(chunk_type, 'value', chunk_type)
+
+    @property
+    def mtrk_events(self):
+        if self._mtrk_events is None:
+            self.decode()
+
+        return(self._mtrk_events)
+
+    # the events are copied into an EventList, so later changes to the given
+    # list do not reach the chunk
+    @mtrk_events.setter
+    def mtrk_events(self, mtrk_events):
+        # the new list starts at version 0, so the count of the old one is
+        # kept to never repeat an earlier version
+        self._version = self.version + 1
+        self._mtrk_events = EventList(mtrk_events)
+
+    # inserting, removing or replacing events is noticed on its own, but this
+    # has to be called after the attributes of an event were edited in place,
+    # e.g. event.tempo = 250000, or indices like tempo_map stay stale
+    def changed(self):
+        self._version += 1
+
+    @property
+    def version(self):
+        if self._mtrk_events is None:
+            return(self._version)
+
+        return(self._version + self._mtrk_events.version)
+
+    @property
+    def decoded(self):
+        return(self._mtrk_events is not None)
+
+    # with a diagnostics list, broken events are appended to it and skipped,
+    # and a missing end of track event is added
+    def decode(self, diagnostics=None):
+        if self._chunk_type != M_TRK:
+            raise(MidiException('Only MTrk chunks contain events'))
+
+        mtrk_events = []
+        start = time.perf_counter() if self.stats is not None else None
+
+        if self._byte_list is not None:
+            tmp_pos = self._offset + 8
+            end = self._offset + 8 + self.length
+            running_status = None
+
+            while tmp_pos < end:
+                try:
+                    new_mtrk_event = MTrkEvent(self._byte_list, tmp_pos, running_status)
+
+                    if tmp_pos + new_mtrk_event.length > end:
+                        raise(MidiException('Truncated event'))
+                except Exception as e:
+                    error = event_error(self._byte_list, tmp_pos, e)
+
+                    if diagnostics is None:
+                        raise(error) from e
+
+                    diagnostics.append(error)
+
+                    tmp_pos = resync_event(self._byte_list, tmp_pos, end)
+                    running_status = None
+
+                    continue
+
+                mtrk_events.append(new_mtrk_event)
+                tmp_pos += new_mtrk_event.length
+                running_status = new_mtrk_event.running_status
+
+        if diagnostics is not None and not is_end_of_track(mtrk_events):
+            diagnostics.append(MidiException('Missing end of track', self._offset))
+
+            end_of_track = MetaEvent.from_values(META_END_OF_TRACK)
+            mtrk_events.append(MTrkEvent.from_values(0, end_of_track))
+
+        if self.stats is not None:
+            self.stats.record('decode', time.perf_counter() - start, self.length)
+            self.stats.record_events(mtrk_events)
+
+        self.mtrk_events = mtrk_events
+
+    # drops the decoded events, they are decoded again from the file data on
+    # the next access, so any changes made to them are lost
+    def free(self):
+        if self._byte_list is not None:
+            self._version = self.version + 1
+            self._mtrk_events = None
+
+    def __iter__(self):
+        if self._chunk_type == M_THD:
+            yield(None)
+        else:
+            for mtrk_event in self.mtrk_events:
+                yield(mtrk_event)
+
+    def __repr__(self):
+        if self._chunk_type == M_THD:
+            return('<Chunk Type: ' + CHUNK_TYPES[self._chunk_type] + ', ' +
+                   'Length: ' + str(self.length) + ', ' +
+                   'File format: ' + str(self.file_format) + ', ' + 
+                   'Tracks count: ' + str(self.tracks_count) + ', ' + 
+                   'Division: ' + str(self.division) + '>')
+        elif self._chunk_type == M_TRK:
+            return('<Chunk Type: ' + CHUNK_TYPES[self._chunk_type] + '. ' +
+                   'Length: ' + str(self.length) + '>')
+
+    def to_bytes(self, running_status=False):
+        bytes_repr = bytearray()
+
+        self.write(bytes_repr, running_status)
+
+        return(bytes(bytes_repr))
+
+    def write(self, bytes_repr, running_status=False):
+        if self._chunk_type == M_TRK and self._mtrk_events is None and not running_status:
+            # never decoded, so the original bytes are still accurate
+            bytes_repr += self._byte_list[self._offset:self._offset + 8 + self.length]
+
+            return
+
+        start = len(bytes_repr)
+
+        bytes_repr += str_to_bytes(self._chunk_type);
+        bytes_repr += uint32_to_bytes(self.length);
+
+        if self._chunk_type == M_THD:
+            bytes_repr += uint16_to_bytes(self.file_format)
+            bytes_repr += uint16_to_bytes(self.tracks_count)
+            bytes_repr += uint16_to_bytes(self.division)
+        elif self._chunk_type == M_TRK:
+            previous_status = None
+
+            for mtrk_event in self.mtrk_events:
+                mtrk_event.write(bytes_repr, previous_status)
+
+                if running_status:
+                    previous_status = mtrk_event.running_status
+
+            # the events may have been edited since the chunk was read, so the
+            # length is patched in from what was actually written
+            bytes_repr[start + 4:start + 8] = uint32_to_bytes(len(bytes_repr) - start - 8)
+
+class MTrkEvent():
+    __slots__ = ('delta_time', 'event', 'length')
+
+    def __init__(self, byte_list, offset=0, running_status=None):
+        self.delta_time, self.length = decode_variable_length_value(byte_list, offset)
+
+        tmp_pos = offset + self.length
+
+        if byte_list[tmp_pos] < 0b10000000 and running_status is not None:
+            # running status, the data bytes follow the delta time directly
+            self.event = MidiEvent(byte_list, tmp_pos, running_status)
+            self.length += self.event.length - 1
+
+            return
+
+        event_class = EVENT_CLASSES[byte_list[tmp_pos]]
+
+        if event_class is None:
+            raise(MidiException('No such event'))
+
+        self.event = event_class(byte_list, tmp_pos)
+        self.length += self.event.length
+
+    @classmethod
+    def from_values(cls, delta_time, event):
+        mtrk_event = cls.__new__(cls)
+        mtrk_event.delta_time = delta_time
+        mtrk_event.event = event
+        mtrk_event.length = variable_length_value_size(delta_time) + event.length
+
+        return(mtrk_event)
+
+    # the status a following event may leave out, sysex and meta events cancel it
+    @property
+    def running_status(self):
+        if type(self.event) is MidiEvent:
+            return(self.event.status)
+        else:
+            return(None)
+
+    def __repr__(self):
+        return('<Delta time: ' + str(self.delta_time) + ', ' +
+               'Event: ' + self.event.__class__.__name__ + '>')
+
+    def to_bytes(self, running_status=None):
+        bytes_repr = bytearray()
+
+        self.write(bytes_repr, running_status)
+
+        return(bytes(bytes_repr))
+
+    def write(self, bytes_repr, running_status=None):
+        write_variable_length_value(bytes_repr, self.delta_time)
+
+        event = self.event
+
+        if type(event) is MidiEvent:
+            if event.status != running_status:
+                bytes_repr.append(event.status)
+
+            bytes_repr.append(event.data1)
+
+            if MIDI_EVENT_LENGTHS[event.status] == 3:
+                bytes_repr.append(event.data2)
+        else:
+            event.write(bytes_repr)
+
+NOTE_OFF = 0b10000000
+NOTE_ON = 0b10010000
+NOTE_PRESSURE = 0b10100000
+CONTROL_CHANGE = 0b10110000
+PROGRAM_CHANGE = 0b11000000
+CHANNEL_PRESSURE = 0b11010000
+PITCH_CHANGE = 0b11100000
+
+MIDI_EVENT_TYPES = {
+    NOTE_OFF: 'note_off',
+    NOTE_ON: 'note_on',
+    NOTE_PRESSURE: 'note_pressure',
+    CONTROL_CHANGE: 'control_change',
+    PROGRAM_CHANGE: 'program_change',
+    CHANNEL_PRESSURE: 'channel_pressure',
+    PITCH_CHANGE: 'pitch_change',
+}
+
+class MidiEvent():
+    __slots__ = ('status', 'data1', 'data2')
+
+    def __init__(self, byte_list, offset=0, running_status=None):
+        if running_status is None:
+            self.status = byte_list[offset]
+            offset += 1
+        else:
+            self.status = running_status
+
+        if MIDI_EVENT_LENGTHS[self.status] == 0:
+            raise(MidiException('No such midi event type'))
+
+        self.data1 = byte_list[offset]
+        self.data2 = byte_list[offset + 1] if MIDI_EVENT_LENGTHS[self.status] == 3 else 0
+
+    @classmethod
+    def from_values(cls, status, data1=0, data2=0):
+        midi_event = cls.__new__(cls)
+        midi_event.status = status
+        midi_event.data1 = data1
+        midi_event.data2 = data2
+
+        return(midi_event)
+
+    @property
+    def length(self):
+        return(MIDI_EVENT_LENGTHS[self.status])
+
+    @property
+    def event_type(self):
+        return(enum_type('MidiEventType')(self.status & 0b11110000))
+
+    @event_type.setter
+    def event_type(self, event_type):
+        self.status = int(event_type) | (self.status & 0b00001111)
+
+    @property
+    def channel_number(self):
+        return(self.status & 0b00001111)
+
+    @channel_number.setter
+    def channel_number(self, channel_number):
+        self.status = (self.status & 0b11110000) | channel_number
+
+    note = DataField('data1', NOTE_OFF, NOTE_ON,
+                     NOTE_PRESSURE)
+    velocity = DataField('data2', NOTE_OFF, NOTE_ON)
+    pressure = DataField('data2', NOTE_PRESSURE)
+    control_number = DataField('data1', CONTROL_CHANGE)
+    new_value = DataField('data2', CONTROL_CHANGE)
+    program_number = DataField('data1', PROGRAM_CHANGE)
+    channel_pressure = DataField('data1', CHANNEL_PRESSURE)
+    bottom = DataField('data1', PITCH_CHANGE)
+    next_value = DataField('data2', PITCH_CHANGE)
+
+    def __repr__(self):
+        if self.event_type == NOTE_OFF or \
+           self.event_type == NOTE_ON:
+            return('<Midi event type: ' + self.event_type.name + ', ' +
+                   'Channel number: ' + str(self.channel_number) + ', ' +
+                   'Note number: ' + str(self.note) + ', ' +
+                   'Velocity: ' + str(self.velocity) + '>')
+        elif self.event_type == NOTE_PRESSURE:
+            return('<Midi event type: ' + self.event_type.name + ', ' +
+                   'Channel number: ' + str(self.channel_number) + ', ' +
+                   'Note number: ' + str(self.note) + ', ' +
+                   'Pressure: ' + str(self.pressure) + '>')
+        elif self.event_type == CONTROL_CHANGE:
+            return('<Midi event type: ' + self.event_type.name + '. ' +
+                   'Channel number: ' + str(self.channel_number) + ', ' +
+                   'Controller number: ' + str(self.control_number) + ', ' +
+                   'New Value: ' + str(self.new_value) + '>')
+        elif self.event_type == PROGRAM_CHANGE:
+            return('<Midi event type: ' + self.event_type.name + ', ' +
+                   'Channel number: ' + str(self.channel_number) + ', ' +
+                   'New program number: ' + str(self.program_number) + '>')
+        elif self.event_type == CHANNEL_PRESSURE:
+            return('<Midi event type: ' + self.event_type.name + ', ' +
+                   'Channel number: ' + str(self.channel_number) + ', ' +
+                   'Pressure: ' + str(self.channel_pressure) + '>')
+        elif self.event_type == PITCH_CHANGE:
+            return('<Midi event type: ' + self.event_type.name + ', ' +
+                   'Channel: ' + str(self.channel_number) + ', ' +
+                   'Bottom: ' + str(self.bottom) + ', ' +
+                   'Next Value: ' + str(self.next_value) + '>')
+
+    def to_bytes(self):
+        if MIDI_EVENT_LENGTHS[self.status] == 3:
+            return(bytes((self.status, self.data1, self.data2)))
+        else:
+            return(bytes((self.status, self.data1)))
+
+    def write(self, bytes_repr):
+        bytes_repr.append(self.status)
+        bytes_repr.append(self.data1)
+
+        if MIDI_EVENT_LENGTHS[self.status] == 3:
+            bytes_repr.append(self.data2)
+
+SYSTEM_EXCLUSIVE = 0b11110000
+SYSTEM_COMMON_SONG_POSITION = 0b11110010
+SYSTEM_COMMON_SONG_SELECT = 0b11110011
+SYSTEM_COMMON_TUNE_REQUEST = 0b11110110
+SYSTEM_COMMON = 0b11110111
+SYSTEM_REAL_TIME_TIMING_CLOCK = 0b11111000
+SYSTEM_REAL_TIME_START = 0b11111010
+SYSTEM_REAL_TIME_CONTINUE = 0b11111011
+SYSTEM_REAL_TIME_STOP = 0b11111100
+SYSTEM_REAL_TIME_ACTIVE_SENSING = 0b11111110
+SYSTEM_REAL_TIME_RESET = 0b11111111
+
+SYSTEM_EVENT_TYPES = {
+    SYSTEM_EXCLUSIVE: 'exclusive',
+    SYSTEM_COMMON_SONG_POSITION: 'common_song_position',
+    SYSTEM_COMMON_SONG_SELECT: 'common_song_select',
+    SYSTEM_COMMON_TUNE_REQUEST: 'common_tune_request',
+    SYSTEM_COMMON: 'common',
+    SYSTEM_REAL_TIME_TIMING_CLOCK: 'real_time_timing_clock',
+    SYSTEM_REAL_TIME_START: 'real_time_start',
+    SYSTEM_REAL_TIME_CONTINUE: 'real_time_continue',
+    SYSTEM_REAL_TIME_STOP: 'real_time_stop',
+    SYSTEM_REAL_TIME_ACTIVE_SENSING: 'real_time_active_sensing',
+    SYSTEM_REAL_TIME_RESET: 'real_time_reset',
+}
+
+class SystemEvent():
+    __slots__ = ('status', 'payload')
+
+    def __init__(self, byte_list, offset=0):
+        self.status = byte_list[offset]
+
+        length = SYSTEM_EVENT_LENGTHS[self.status]
+
+        if length == 0:
+            raise(MidiException('No such system event type'))
+
+        if length is None:
+            tmp_pos = offset + 1
+
+            while byte_list[tmp_pos] != SYSTEM_COMMON:
+                tmp_pos += 1
+
+            self.payload = bytes(byte_list[offset + 1:tmp_pos])
+        else:
+            self.payload = bytes(byte_list[offset + 1:offset + length])
+
+    @classmethod
+    def from_values(cls, status, payload=b''):
+        system_event = cls.__new__(cls)
+        system_event.status = status
+        system_event.payload = payload
+
+        return(system_event)
+
+    @property
+    def length(self):
+        if SYSTEM_EVENT_LENGTHS[self.status] is None:
+            return(len(self.payload) + 2)
+        else:
+            return(len(self.payload) + 1)
+
+    @property
+    def event_type(self):
+        return(enum_type('SystemEventType')(self.status))
+
+    def __repr__(self):
+        if self.event_type == SYSTEM_EXCLUSIVE or \
+           self.event_type == SYSTEM_COMMON:
+            return('<System event type: ' + self.event_type.name + ', ' +
+                   'Payload: ' + str(self.payload) + '>')
+        else:
+            return('<System event type: ' + self.event_type.name + '>')
+
+    def to_bytes(self):
+        bytes_repr = bytearray()
+
+        self.write(bytes_repr)
+
+        return(bytes(bytes_repr))
+
+    def write(self, bytes_repr):
+        bytes_repr.append(self.status)
+        bytes_repr += self.payload
+
+        if SYSTEM_EVENT_LENGTHS[self.status] is None:
+            bytes_repr.append(SYSTEM_COMMON)
+
+META_SEQUENCE_NUMBER = 0b00000000
+META_TEXT = 0b00000001
+META_COPYRIGHT_NOTICE = 0b00000010
+META_TEXT_SEQUENCE_OR_TRACK_NAME = 0b00000011
+META_INSTRUMENT_NAME = 0b00000100
+META_LYRIC = 0b00000101
+META_MARKER = 0b0000110
+META_CUE_POINT = 0b00000111
+META_CHANNEL_PREFIX = 0b00100000
+META_END_OF_TRACK = 0b00101111
+META_TEMPO = 0b01010001
+META_SMPTE_OFFSET = 0b01010100
+META_TIME_SIGNATURE = 0b01011000
+META_KEY_SIGNATURE = 0b01011001
+META_SEQUENCER_SPECIFIC_PAYLOAD = 0b01111111
+
+META_EVENT_TYPES = {
+    META_SEQUENCE_NUMBER: 'sequence_number',
+    META_TEXT: 'text',
+    META_COPYRIGHT_NOTICE: 'copyright_notice',
+    META_TEXT_SEQUENCE_OR_TRACK_NAME: 'text_sequence_or_track_name',
+    META_INSTRUMENT_NAME: 'instrument_name',
+    META_LYRIC: 'lyric',
+    META_MARKER: 'marker',
+    META_CUE_POINT: 'cue_point',
+    META_CHANNEL_PREFIX: 'channel_prefix',
+    META_END_OF_TRACK: 'end_of_track',
+    META_TEMPO: 'tempo',
+    META_SMPTE_OFFSET: 'smpte_offset',
+    META_TIME_SIGNATURE: 'time_signature',
+    META_KEY_SIGNATURE: 'key_signature',
+    META_SEQUENCER_SPECIFIC_PAYLOAD: 'sequencer_specific_payload',
+}
+
+class MetaEvent():
+    __slots__ = ('meta_type', 'payload')
+
+    def __init__(self, byte_list, offset=0):
+        if byte_list[offset] == 0b11111111:
+            self.meta_type = byte_list[offset + 1]
+
+            if self.meta_type not in META_EVENT_TYPES:
+                raise(MidiException('No such meta event'))
+
+            payload_length, length = decode_variable_length_value(byte_list, offset + 2)
+
+            tmp_pos = offset + 2 + length
+
+            self.payload = bytes(byte_list[tmp_pos:tmp_pos + payload_length])
+
+            if len(self.payload) != payload_length:
+                raise(MidiException('Truncated meta event'))
+        else:
+            raise(MidiException('Not a meta event'))
+
+    @classmethod
+    def from_values(cls, meta_type, payload=b''):
+        meta_event = cls.__new__(cls)
+        meta_event.meta_type = meta_type
+        meta_event.payload = payload
+
+        return(meta_event)
+
+    @property
+    def length(self):
+        return(2 + variable_length_value_size(len(self.payload)) + len(self.payload))
+
+    @property
+    def payload_length(self):
+        return(len(self.payload))
+
+    @property
+    def event_type(self):
+        return(enum_type('MetaEventType')(self.meta_type))
+
+    sequence_number = payload_property(META_SEQUENCE_NUMBER, bytes_to_uint16, uint16_to_bytes)
+    text = payload_property(META_TEXT, bytes_to_str, str_to_bytes)
+    copyright_notice = payload_property(META_COPYRIGHT_NOTICE, bytes_to_str, str_to_bytes)
+    text_sequence_or_track_name = payload_property(META_TEXT_SEQUENCE_OR_TRACK_NAME,
+                                                   bytes_to_str, str_to_bytes)
+    instrument_name = payload_property(META_INSTRUMENT_NAME, bytes_to_str, str_to_bytes)
+    lyric = payload_property(META_LYRIC, bytes_to_str, str_to_bytes)
+    marker = payload_property(META_MARKER, bytes_to_str, str_to_bytes)
+    cue_point = payload_property(META_CUE_POINT, bytes_to_str, str_to_bytes)
+    channel_prefix = payload_property(META_CHANNEL_PREFIX,
+                                      lambda x: x[0], lambda x: bytes((x,)))
+    tempo = payload_property(META_TEMPO, bytes_to_uint24, uint24_to_bytes)
+    smpte_offset = payload_property(META_SMPTE_OFFSET, bytes, bytes)
+    time_signature = payload_property(META_TIME_SIGNATURE, bytes, bytes)
+    key_signature = payload_property(META_KEY_SIGNATURE, bytes, bytes)
+    sequencer_specific_payload = payload_property(META_SEQUENCER_SPECIFIC_PAYLOAD,
+                                                  bytes, bytes)
+
+    def __repr__(self):
+        if self.event_type == META_SEQUENCE_NUMBER:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Sequence number: ' + str(self.sequence_number) + '>')
+        elif self.event_type == META_TEXT:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Text: ' + self.text + '>')
+        elif self.event_type == META_COPYRIGHT_NOTICE:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Copyright notice: ' + self.copyright_notice + '>')
+        elif self.event_type == META_TEXT_SEQUENCE_OR_TRACK_NAME:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Text sequence or track name: ' + self.text_sequence_or_track_name + '>')
+        elif self.event_type == META_INSTRUMENT_NAME:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Instrument name: ' + self.instrument_name + '>')
+        elif self.event_type == META_LYRIC:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Lyric: ' + self.lyric + '>')
+        elif self.event_type == META_MARKER:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Marker: ' + self.marker + '>')
+        elif self.event_type == META_CUE_POINT:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Cue point: ' + self.cue_point + '>')
+        elif self.event_type == META_CHANNEL_PREFIX:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Channel prefix: ' + str(self.channel_prefix) + '>')
+        elif self.event_type == META_END_OF_TRACK:
+            return('<Meta event type: ' + self.event_type.name + '>')
+        elif self.event_type == META_TEMPO:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Tempo: ' + str(self.tempo) + '>')
+        elif self.event_type == META_SMPTE_OFFSET:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'SMPTE offset: ' + str(self.smpte_offset) + '>')
+        elif self.event_type == META_TIME_SIGNATURE:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Time signature: ' + str(self.time_signature) + '>')
+        elif self.event_type == META_KEY_SIGNATURE:
+            return('<Meta event type: ' + self.event_type.name + ', ' + 
+                   'Key signature: ' + str(self.key_signature) + '>')
+        elif self.event_type == META_SEQUENCER_SPECIFIC_PAYLOAD:
+            return('<Meta event type: ' + self.event_type.name + ', ' +
+                   'Sequencer specific payload: ' + str(self.sequencer_specific_payload) + '>')
+
+    def to_bytes(self):
+        bytes_repr = bytearray()
+
+        self.write(bytes_repr)
+
+        return(bytes(bytes_repr))
+
+    def write(self, bytes_repr):
+        bytes_repr.append(0b11111111)
+        bytes_repr.append(self.meta_type)
+        write_variable_length_value(bytes_repr, len(self.payload))
+        bytes_repr += self.payload
+
+# dispatch tables indexed by status byte, a length of 0 marks an unknown status
+MIDI_EVENT_LENGTHS = [0] * 256
+
+for status in range(0b10000000, 0b11110000):
+    if (status & 0b11110000) in MIDI_EVENT_TYPES:
+        MIDI_EVENT_LENGTHS[status] = 2 if 0b11000000 <= status < 0b11100000 else 3
+
+# sysex has no fixed length, it runs up to the terminating 0b11110111
+SYSTEM_EVENT_LENGTHS = [0] * 256
+SYSTEM_EVENT_LENGTHS[SYSTEM_EXCLUSIVE] = None
+SYSTEM_EVENT_LENGTHS[SYSTEM_COMMON] = None
+SYSTEM_EVENT_LENGTHS[SYSTEM_COMMON_SONG_POSITION] = 3
+SYSTEM_EVENT_LENGTHS[SYSTEM_COMMON_SONG_SELECT] = 2
+
+for status in SYSTEM_EVENT_TYPES:
+    if SYSTEM_EVENT_LENGTHS[status] == 0:
+        SYSTEM_EVENT_LENGTHS[status] = 1
+
+EVENT_CLASSES = [None] * 256
+
+for status in range(256):
+    if MIDI_EVENT_LENGTHS[status] != 0:
+        EVENT_CLASSES[status] = MidiEvent
+    elif SYSTEM_EVENT_LENGTHS[status] != 0:
+        EVENT_CLASSES[status] = SystemEvent
+
+del status
+
+# in files 0b11111111 starts a meta event, only on the wire it is a reset
+EVENT_CLASSES[0b11111111] = MetaEvent
+
+# the Enum classes are only built, and enum only imported, when one of them
+# is first used, ChunkType members are strings and the others integers, so
+# they compare equal to the plain values used everywhere else
+ENUM_TYPES = {
+    'ChunkType': (str, CHUNK_TYPES),
+    'MidiEventType': (int, MIDI_EVENT_TYPES),
+    'SystemEventType': (int, SYSTEM_EVENT_TYPES),
+    'MetaEventType': (int, META_EVENT_TYPES),
+}
+
+def enum_type(name):
+    if name not in globals():
+        from enum import Enum
+
+        value_type, names = ENUM_TYPES[name]
+
+        globals()[name] = Enum(name, list(map(lambda x: (x[1], x[0]), names.items())),
+                               module=__name__, type=value_type)
+
+    return(globals()[name])
+
+def __getattr__(name):
+    if name in ENUM_TYPES:
+        return(enum_type(name))
+    elif name == '__all__':
+        # what a star import would take anyway, plus the Enum classes
+        return(list(filter(lambda x: not x.startswith('_'), globals())) + list(ENUM_TYPES))
+
+    raise(AttributeError("module '" + __name__ + "' has no attribute '" + name + "'"))
+
+COMPACT_COLUMNS = ('delta_times', 'ticks', 'statuses', 'channels', 'data1', 'data2', 'running')
+
+class CompactTrack():
+    def __init__(self):
+        self.delta_times = array.array('I')
+        self.ticks = array.array('Q')
+        self.statuses = array.array('B')
+        self.channels = array.array('B')
+        self.data1 = array.array('B')
+        self.data2 = array.array('B')
+
+        # 1 where the status byte was left out in the decoded data, only kept
+        # so that events built from the track get the same lengths as parsed ones
+        self.running = array.array('B')
+
+        # payload of event i is payloads[payload_offsets[i]:payload_offsets[i + 1]]
+        self.payload_offsets = array.array('I', [0])
+        self.payloads = bytearray()
+
+    @classmethod
+    def from_bytes(cls, byte_list, offset=0):
+        if bytes(byte_list[offset:offset + 4]) != b'MTrk':
+            raise(MidiException('Not a MTrk chunk'))
+
+        length = bytes_to_uint32(byte_list, offset + 4)
+
+        if offset + 8 + length > len(byte_list):
+            raise(MidiException('Truncated chunk', offset))
+
+        compact_track = cls()
+        compact_track.decode(byte_list, offset + 8, offset + 8 + length)
+
+        return(compact_track)
+
+    @classmethod
+    def from_chunk(cls, chunk):
+        if chunk._chunk_type != M_TRK:
+            raise(MidiException('Not a MTrk chunk'))
+
+        byte_list = b''.join(map(lambda x: x.to_bytes(), chunk.mtrk_events))
+
+        compact_track = cls()
+        compact_track.decode(byte_list, 0, len(byte_list))
+
+        return(compact_track)
+
+    def __len__(self):
+        return(len(self.statuses))
+
+    def __iter__(self):
+        for i in range(len(self.statuses)):
+            yield((self.delta_times[i], self.ticks[i], self.statuses[i],
+                   self.channels[i], self.data1[i], self.data2[i],
+                   self.payload(i)))
+
+    def __repr__(self):
+        return('<Compact track Events: ' + str(len(self)) + ', ' +
+               'Payload bytes: ' + str(len(self.payloads)) + '>')
+
+    def payload(self, index):
+        return(bytes(self.payloads[self.payload_offsets[index]:self.payload_offsets[index + 1]]))
+
+    def copy(self):
+        compact_track = CompactTrack()
+
+        for name in COMPACT_COLUMNS + ('payload_offsets',):
+            setattr(compact_track, name, array.array(getattr(self, name).typecode, getattr(self, name)))
+
+        compact_track.payloads = bytearray(self.payloads)
+
+        return(compact_track)
+
+    # a new track holding the events at the given indices in that order
+    def take(self, indices):
+        indices = list(indices)
+        compact_track = CompactTrack()
+
+        for name in COMPACT_COLUMNS:
+            column = getattr(self, name)
+            setattr(compact_track, name, array.array(column.typecode, map(column.__getitem__, indices)))
+
+        # the events no longer follow the ones they left out the status of
+        compact_track.running = array.array('B', bytes(len(indices)))
+
+        payloads = list(map(self.payload, indices))
+
+        compact_track.payloads = bytearray(b''.join(payloads))
+        compact_track.payload_offsets = array.array('I', itertools.accumulate(map(len, payloads), initial=0))
+        compact_track.update_delta_times()
+
+        return(compact_track)
+
+    # recomputes the delta times after the absolute ticks were changed
+    def update_delta_times(self):
+        self.delta_times = array.array('I', map(operator.sub, self.ticks,
+                                                itertools.chain((0,), self.ticks)))
+
+    def append(self, delta_time, status, data1=0, data2=0, payload=b'', running=0):
+        tick = self.ticks[-1] + delta_time if self.ticks else delta_time
+
+        self.delta_times.append(delta_time)
+        self.ticks.append(tick)
+        self.statuses.append(status)
+        self.channels.append(status & 0b00001111 if status < 0b11110000 else 0)
+        self.data1.append(data1)
+        self.data2.append(data2)
+        self.running.append(running)
+
+        self.payloads += payload
+        self.payload_offsets.append(len(self.payloads))
+
+    # raises the same errors as decoding the track into MTrkEvent objects
+    def decode(self, byte_list, start, end):
+        tmp_pos = start
+        running_status = None
+
+        while tmp_pos < end:
+            event_pos = tmp_pos
+
+            try:
+                delta_time, length = decode_variable_length_value(byte_list, tmp_pos)
+                tmp_pos += length
+                status = byte_list[tmp_pos]
+                running = 0
+
+                if status < 0b10000000 and running_status is not None:
+                    # running status, the data bytes follow the delta time directly
+                    status = running_status
+                    running = 1
+                    tmp_pos -= 1
+
+                if MIDI_EVENT_LENGTHS[status] == 3:
+                    self.append(delta_time, status, byte_list[tmp_pos + 1],
+                                byte_list[tmp_pos + 2], b'', running)
+                    tmp_pos += 3
+                    running_status = status
+                elif MIDI_EVENT_LENGTHS[status] == 2:
+                    self.append(delta_time, status, byte_list[tmp_pos + 1], 0, b'', running)
+                    tmp_pos += 2
+                    running_status = status
+                elif status == 0b11111111:
+                    meta_type = byte_list[tmp_pos + 1]
+
+                    if meta_type not in META_EVENT_TYPES:
+                        raise(MidiException('No such meta event'))
+
+                    payload_length, length = decode_variable_length_value(byte_list, tmp_pos + 2)
+                    payload_start = tmp_pos + 2 + length
+
+                    if payload_start + payload_length > len(byte_list):
+                        raise(MidiException('Truncated meta event'))
+
+                    self.append(delta_time, status, meta_type, 0,
+                                byte_list[payload_start:payload_start + payload_length])
+                    tmp_pos = payload_start + payload_length
+                    running_status = None
+                elif SYSTEM_EVENT_LENGTHS[status] is None:
+                    payload_end = tmp_pos + 1
+
+                    while byte_list[payload_end] != 0b11110111:
+                        payload_end += 1
+
+                    self.append(delta_time, status, 0, 0, byte_list[tmp_pos + 1:payload_end])
+                    tmp_pos = payload_end + 1
+                    running_status = None
+                elif SYSTEM_EVENT_LENGTHS[status] != 0:
+                    length = SYSTEM_EVENT_LENGTHS[status]
+                    self.append(delta_time, status,
+                                byte_list[tmp_pos + 1] if length > 1 else 0,
+                                byte_list[tmp_pos + 2] if length > 2 else 0)
+                    tmp_pos += length
+                    running_status = None
+                else:
+                    raise(MidiException('No such event'))
+
+                if tmp_pos > end:
+                    raise(MidiException('Truncated event'))
+            except (IndexError, MidiException) as e:
+                raise(event_error(byte_list, event_pos, e)) from e
+
+    def to_bytes(self, running_status=False):
+        bytes_repr = bytearray()
+
+        self.write(bytes_repr, running_status)
+
+        return(bytes(bytes_repr))
+
+    def write(self, bytes_repr, running_status=False):
+        start = len(bytes_repr)
+        previous_status = None
+
+        bytes_repr += b'MTrk\x00\x00\x00\x00'
+
+        for i in range(len(self.statuses)):
+            status = self.statuses[i]
+
+            write_variable_length_value(bytes_repr, self.delta_times[i])
+
+            if not running_status or status != previous_status:
+                bytes_repr.append(status)
+
+            if MIDI_EVENT_LENGTHS[status] == 3:
+                bytes_repr.append(self.data1[i])
+                bytes_repr.append(self.data2[i])
+                previous_status = status
+            elif MIDI_EVENT_LENGTHS[status] == 2:
+                bytes_repr.append(self.data1[i])
+                previous_status = status
+            elif status == 0b11111111:
+                bytes_repr.append(self.data1[i])
+                write_variable_length_value(bytes_repr,
+                                            self.payload_offsets[i + 1] - self.payload_offsets[i])
+                bytes_repr += self.payloads[self.payload_offsets[i]:self.payload_offsets[i + 1]]
+                previous_status = None
+            elif SYSTEM_EVENT_LENGTHS[status] is None:
+                bytes_repr += self.payloads[self.payload_offsets[i]:self.payload_offsets[i + 1]]
+                bytes_repr.append(0b11110111)
+                previous_status = None
+            else:
+                if SYSTEM_EVENT_LENGTHS[status] > 1:
+                    bytes_repr.append(self.data1[i])
+
+                if SYSTEM_EVENT_LENGTHS[status] > 2:
+                    bytes_repr.append(self.data2[i])
+
+                previous_status = None
+
+        bytes_repr[start + 4:start + 8] = uint32_to_bytes(len(bytes_repr) - start - 8)
+
+    def to_mtrk_events(self):
+        mtrk_events = []
+
+        new_mtrk_event = MTrkEvent.__new__
+        new_midi_event = MidiEvent.__new__
+
+        for i, delta_time, status, data1, data2, running in zip(range(len(self.statuses)),
+                                                                self.delta_times, self.statuses,
+                                                                self.data1, self.data2, self.running):
+            # channel events are by far the most common, build them inline
+            if MIDI_EVENT_LENGTHS[status] != 0:
+                event = new_midi_event(MidiEvent)
+                event.status = status
+                event.data1 = data1
+                event.data2 = data2
+
+                mtrk_event = new_mtrk_event(MTrkEvent)
+                mtrk_event.delta_time = delta_time
+                mtrk_event.event = event
+                mtrk_event.length = MIDI_EVENT_LENGTHS[status] - running + \
+                    (1 if delta_time < 0b10000000 else variable_length_value_size(delta_time))
+
+                mtrk_events.append(mtrk_event)
+
+                continue
+
+            if status == 0b11111111:
+                event = MetaEvent.from_values(data1, self.payload(i))
+            elif SYSTEM_EVENT_LENGTHS[status] is None:
+                event = SystemEvent.from_values(status, self.payload(i))
+            else:
+                payload = bytes((data1, data2))[:SYSTEM_EVENT_LENGTHS[status] - 1]
+                event = SystemEvent.from_values(status, payload)
+
+            mtrk_events.append(MTrkEvent.from_values(delta_time, event))
+
+        return(mtrk_events)
+
+    def to_chunk(self):
+        return(Chunk.from_events(self.to_mtrk_events()))
+
+class CompactMidiFile():
+    def __init__(self, file_format=1, division=480, tracks=None, path=None):
+        self.path = path
+        self.file_format = file_format
+        self.division = division
+        self.tracks = tracks if tracks is not None else []
+
+        # problems skipped while loading with recover
+        self.diagnostics = []
+
+    @classmethod
+    def from_bytes(cls, byte_list, path=None):
+        compact_midi_file = cls(path=path)
+        file_pos = 0
+        chunk_index = 0
+
+        while file_pos < len(byte_list):
+            chunk_type = bytes(byte_list[file_pos:file_pos + 4])
+            length = bytes_to_uint32(byte_list, file_pos + 4)
+
+            if chunk_type == b'MThd':
+                compact_midi_file.file_format = bytes_to_uint16(byte_list, file_pos + 8)
+                compact_midi_file.division = bytes_to_uint16(byte_list, file_pos + 12)
+            elif chunk_type == b'MTrk':
+                try:
+                    compact_midi_file.tracks.append(CompactTrack.from_bytes(byte_list, file_pos))
+                except MidiException as e:
+                    e.chunk_index = chunk_index
+                    raise
+            else:
+                raise(MidiException('No such chunk type', file_pos, chunk_index))
+
+            file_pos += 8 + length
+            chunk_index += 1
+
+        return(compact_midi_file)
+
+    @classmethod
+    def from_midi_file(cls, midi_file):
+        compact_midi_file = cls(path=midi_file.path)
+
+        for chunk in midi_file.chunks:
+            if chunk._chunk_type == M_THD:
+                compact_midi_file.file_format = chunk.file_format
+                compact_midi_file.division = chunk.division
+            else:
+                compact_midi_file.tracks.append(CompactTrack.from_chunk(chunk))
+
+        return(compact_midi_file)
+
+    @property
+    def tracks_count(self):
+        return(len(self.tracks))
+
+    # a new file with function(track, *args, **kwargs) applied to every track
+    def map(self, function, *args, **kwargs):
+        tracks = list(map(lambda x: function(x, *args, **kwargs), self.tracks))
+
+        return(CompactMidiFile(self.file_format, self.division, tracks, self.path))
+
+    def to_midi_file(self):
+        chunks = [Chunk(b'MThd' + uint32_to_bytes(6) + uint16_to_bytes(self.file_format) +
+                        uint16_to_bytes(self.tracks_count) + uint16_to_bytes(self.division))]
+
+        for track in self.tracks:
+            chunks.append(track.to_chunk())
+
+        return(MidiFile.from_chunks(chunks, self.path))
+
+    def __iter__(self):
+        for track in self.tracks:
+            yield(track)
+
+    def __repr__(self):
+        return('<Compact file: ' + str(self.path) + ', ' +
+               'File format: ' + str(self.file_format) + ', ' +
+               'Tracks count: ' + str(self.tracks_count) + ', ' +
+               'Division: ' + str(self.division) + '>')
+
+    def to_bytes(self, running_status=False):
+        bytes_repr = bytearray()
+
+        bytes_repr += b'MThd' + uint32_to_bytes(6)
+        bytes_repr += uint16_to_bytes(self.file_format)
+        bytes_repr += uint16_to_bytes(self.tracks_count)
+        bytes_repr += uint16_to_bytes(self.division)
+
+        for track in self.tracks:
+            track.write(bytes_repr, running_status)
+
+        return(bytes(bytes_repr))
+
+# the transforms below work on whole columns at once: per event changes go
+# through 256 entry bytes.translate tables and are merged into the original
+# column with a byte mask using big integer and/or, all of which runs in C
+
+def status_table(function):
+    return(bytes(map(lambda x: 0b11111111 if function(x) else 0, range(256))))
+
+def blend(mask, selected, other):
+    mask_value = int.from_bytes(mask, 'little')
+    value = (int.from_bytes(selected, 'little') & mask_value) | \
+            (int.from_bytes(other, 'little') & ~mask_value)
+
+    return(value.to_bytes(len(mask), 'little'))
+
+def channel_mask(compact_track, event_types, channels=None):
+    values = set(map(int, event_types))
+
+    def selected(status):
+        return((status & 0b11110000) in values and
+               (channels is None or (status & 0b00001111) in channels))
+
+    return(compact_track.statuses.tobytes().translate(status_table(selected)))
+
+def transpose(compact_track, semitones, channels=None):
+    mask = channel_mask(compact_track, (NOTE_OFF, NOTE_ON,
+                                        NOTE_PRESSURE), channels)
+    table = bytes(map(lambda x: min(max(x + semitones, 0), 127) if x < 128 else x, range(256)))
+    data1 = compact_track.data1.tobytes()
+
+    compact_track = compact_track.copy()
+    compact_track.data1 = array.array('B', blend(mask, data1.translate(table), data1))
+
+    return(compact_track)
+
+# curve maps each velocity 1-127 to a new one, either a callable or a 128
+# entry sequence, note ons keep a velocity of at least 1 so they stay notes
+def scale_velocity(compact_track, factor=1.0, curve=None, channels=None):
+    if curve is None:
+        curve = lambda x: x * factor
+    elif not callable(curve):
+        curve = curve.__getitem__
+
+    mask = channel_mask(compact_track, (NOTE_ON,), channels)
+    table = bytes([0] + list(map(lambda x: min(max(int(round(curve(x))), 1), 127), range(1, 128))) +
+                  list(range(128, 256)))
+    data2 = compact_track.data2.tobytes()
+
+    compact_track = compact_track.copy()
+    compact_track.data2 = array.array('B', blend(mask, data2.translate(table), data2))
+
+    return(compact_track)
+
+# mapping is a dict or a 16 entry sequence of new channel numbers from 0 to 15
+def remap_channels(compact_track, mapping):
+    if isinstance(mapping, dict):
+        mapping = list(map(lambda x: mapping.get(x, x), range(16)))
+
+    # a larger channel number would carry into the status and change the event type
+    if len(mapping) != 16 or not all(map(lambda x: 0 <= x <= 15, mapping)):
+        raise(MidiException('Invalid channel number'))
+
+    table = bytes(map(lambda x: (x & 0b11110000) | mapping[x & 0b00001111]
+                      if 0b10000000 <= x < 0b11110000 else x, range(256)))
+
+    compact_track = compact_track.copy()
+    compact_track.statuses = array.array('B', compact_track.statuses.tobytes().translate(table))
+    compact_track.channels = array.array('B', map(lambda x: x & 0b00001111 if x < 0b11110000 else 0,
+                                                   compact_track.statuses))
+
+    return(compact_track)
+
+def stretch(compact_track, factor):
+    compact_track = compact_track.copy()
+    compact_track.ticks = array.array('Q', map(lambda x: int(round(x * factor)), compact_track.ticks))
+    compact_track.update_delta_times()
+
+    return(compact_track)
+
+# moves events towards the nearest multiple of grid, strength 1.0 snaps them
+def quantize(compact_track, grid, strength=1.0):
+    ticks = array.array('Q', map(lambda x: int(round(x + (round(x / grid) * grid - x) * strength)),
+                                 compact_track.ticks))
+
+    # snapping can reorder events, sorted is stable so ties keep their order
+    order = sorted(range(len(ticks)), key=ticks.__getitem__)
+
+    compact_track = compact_track.copy()
+    compact_track.ticks = ticks
+
+    return(compact_track.take(order))
+
+# keeps only the events whose status is in event_types or whose meta type is
+# in meta_types, or drops them if exclude. event types are NOTE_ON and the
+# other midi event types, which cover all 16 channels, single status bytes,
+# or members of MidiEventType and SystemEventType. meta types are META_TEMPO
+# and so on, or members of MetaEventType, they need their own argument as
+# their values overlap with status bytes. the end of track event that ends
+# the track is always kept, so the result is still a complete track
+def filter_events(compact_track, event_types=(), exclude=False, meta_types=()):
+    statuses = set()
+    meta_types = set(map(int, meta_types))
+
+    for event_type in event_types:
+        # a MetaEventType member can only exist once the enum was built
+        if 'MetaEventType' in globals() and isinstance(event_type, MetaEventType):
+            meta_types.add(int(event_type))
+        elif int(event_type) in MIDI_EVENT_TYPES:
+            statuses.update(range(int(event_type), int(event_type) + 16))
+        elif 0b10000000 <= int(event_type) <= 0b11111111:
+            statuses.add(int(event_type))
+        else:
+            raise(MidiException('No such event type'))
+
+    selected = itertools.starmap(lambda x, y: (x in statuses or
+                                               (x == 0b11111111 and y in meta_types)) != exclude,
+                                 zip(compact_track.statuses, compact_track.data1))
+
+    indices = list(itertools.compress(range(len(compact_track)), selected))
+    last = len(compact_track) - 1
+
+    if last >= 0 and compact_track.statuses[last] == 0b11111111 and \
+       compact_track.data1[last] == META_END_OF_TRACK and (not indices or indices[-1] != last):
+        indices.append(last)
+
+    return(compact_track.take(indices))
+
+# piano rolls and tokens are built straight from the compact columns, notes
+# are paired on them and written into flat row major buffers that numpy and
+# scipy can wrap without copying, neither of them is needed otherwise
+
+NOTE_STATUS_TABLE = status_table(lambda x: x & 0b11100000 == 0b10000000)
+
+# starts, ends, pitches, velocities and channels of the notes of a track,
+# notes that are never released end at the last event of the track
+def note_columns(compact_track, channels=None):
+    starts = array.array('Q')
+    ends = array.array('Q')
+    pitches = array.array('B')
+    velocities = array.array('B')
+    note_channels = array.array('B')
+
+    statuses = compact_track.statuses
+    ticks = compact_track.ticks
+    data1 = compact_track.data1
+    data2 = compact_track.data2
+
+    open_notes = {}
+    mask = statuses.tobytes().translate(NOTE_STATUS_TABLE)
+
+    def add_note(start, end, channel, pitch, velocity):
+        starts.append(start)
+        ends.append(end)
+        pitches.append(pitch)
+        velocities.append(velocity)
+        note_channels.append(channel)
+
+    for i in itertools.compress(range(len(compact_track)), mask):
+        channel = statuses[i] & 0b00001111
+
+        if channels is not None and channel not in channels:
+            continue
+
+        key = (channel, data1[i])
+
+        if statuses[i] & 0b11110000 == NOTE_ON and data2[i] != 0:
+            open_notes.setdefault(key, collections.deque()).append((ticks[i], data2[i]))
+        elif open_notes.get(key):
+            start, velocity = open_notes[key].popleft()
+            add_note(start, ticks[i], key[0], key[1], velocity)
+
+    end = ticks[-1] if len(ticks) else 0
+
+    for key, notes in open_notes.items():
+        for start, velocity in notes:
+            add_note(start, end, key[0], key[1], velocity)
+
+    return(starts, ends, pitches, velocities, note_channels)
+
+# tick to frame conversion, frames are step ticks or seconds seconds long,
+# the default step is a sixteenth note
+def frame_function(compact_midi_file, step=None, seconds=None):
+    if seconds is not None:
+        tempo_map = TempoMap.from_compact(compact_midi_file)
+
+        return(lambda x: int(tempo_map.tick_to_seconds(x) / seconds))
+
+    if step is None:
+        step = max((compact_midi_file.division & 0b0111111111111111) // 4, 1)
+
+    return(lambda x: x // step)
+
+# the notes of all tracks in frames, every note lasts at least one frame
+def frame_notes(compact_midi_file, step=None, seconds=None, channels=None):
+    frame = frame_function(compact_midi_file, step, seconds)
+
+    starts = array.array('I')
+    ends = array.array('I')
+    pitches = array.array('B')
+    velocities = array.array('B')
+
+    for track in compact_midi_file.tracks:
+        track_starts, track_ends, track_pitches, track_velocities, _ = note_columns(track, channels)
+        track_starts = array.array('I', map(frame, track_starts))
+
+        starts += track_starts
+        ends += array.array('I', map(max, map(frame, track_ends),
+                                     map((1).__add__, track_starts)))
+        pitches += track_pitches
+        velocities += track_velocities
+
+    return(starts, ends, pitches, velocities)
+
+# yields zero copy views of size rows of width items, hop rows apart, only
+# complete windows are yielded
+def sliding_windows(buffer, size, hop=None, width=1):
+    hop = size if hop is None else hop
+    view = memoryview(buffer)
+    rows_count = len(view) // width
+
+    for start in range(0, rows_count - size + 1, hop):
+        yield(view[start * width:(start + size) * width])
+
+class PianoRoll():
+    def __init__(self, frames_count, data=None):
+        self.frames_count = frames_count
+        self.data = data if data is not None else bytearray(128 * frames_count)
+
+    def __len__(self):
+        return(self.frames_count)
+
+    def __repr__(self):
+        return('<Piano roll Frames count: ' + str(self.frames_count) + '>')
+
+    def frame(self, i):
+        return(memoryview(self.data)[i * 128:(i + 1) * 128])
+
+    def windows(self, size, hop=None):
+        return(sliding_windows(self.data, size, hop, 128))
+
+    # frames x 128 uint8 array sharing the buffer
+    def to_numpy(self):
+        import numpy
+
+        return(numpy.frombuffer(self.data, numpy.uint8).reshape(self.frames_count, 128))
+
+# the active cells only, keys are frame * 128 + pitch in ascending order
+class SparsePianoRoll():
+    def __init__(self, frames_count, keys=None, values=None):
+        self.frames_count = frames_count
+        self.keys = keys if keys is not None else array.array('I')
+        self.values = values if values is not None else array.array('B')
+
+    def __len__(self):
+        return(self.frames_count)
+
+    def __repr__(self):
+        return('<Sparse piano roll Frames count: ' + str(self.frames_count) + ', ' +
+               'Cells count: ' + str(len(self.keys)) + '>')
+
+    @property
+    def frames(self):
+        return(array.array('I', map((7).__rrshift__, self.keys)))
+
+    @property
+    def pitches(self):
+        return(array.array('B', map((127).__and__, self.keys)))
+
+    # the cells of frames start to start + size, with keys relative to start
+    def window(self, start, size):
+        i = bisect.bisect_left(self.keys, start * 128)
+        j = bisect.bisect_left(self.keys, (start + size) * 128)
+
+        return(SparsePianoRoll(size, array.array('I', map((start * 128).__rsub__, self.keys[i:j])),
+                               self.values[i:j]))
+
+    def windows(self, size, hop=None):
+        hop = size if hop is None else hop
+
+        for start in range(0, self.frames_count - size + 1, hop):
+            yield(self.window(start, size))
+
+    def to_dense(self):
+        data = bytearray(128 * self.frames_count)
+
+        for key, value in zip(self.keys, self.values):
+            data[key] = value
+
+        return(PianoRoll(self.frames_count, data))
+
+    def to_scipy(self):
+        import scipy.sparse
+
+        return(scipy.sparse.coo_matrix((self.values, (self.frames, self.pitches)),
+                                       shape=(self.frames_count, 128)))
+
+# cells hold the velocity, or 1 without velocity, a later note on the same
+# pitch overwrites an earlier one where they overlap
+def piano_roll(compact_midi_file, step=None, seconds=None, velocity=True, sparse=False,
+               channels=None):
+    starts, ends, pitches, velocities = frame_notes(compact_midi_file, step, seconds, channels)
+    frames_count = max(ends) if len(ends) else 0
+
+    if not velocity:
+        velocities = bytes([1]) * len(velocities)
+
+    if sparse:
+        cells = {}
+
+        for start, end, pitch, value in zip(starts, ends, pitches, velocities):
+            cells.update(zip(range(start * 128 + pitch, end * 128 + pitch, 128),
+                             itertools.repeat(value)))
+
+        keys = array.array('I', sorted(cells))
+
+        return(SparsePianoRoll(frames_count, keys, array.array('B', map(cells.__getitem__, keys))))
+
+    roll = PianoRoll(frames_count)
+
+    # every note is a single strided slice assignment
+    for start, end, pitch, value in zip(starts, ends, pitches, velocities):
+        roll.data[start * 128 + pitch:end * 128 + pitch:128] = bytes([value]) * (end - start)
+
+    return(roll)
+
+# fixed vocabulary: note on per pitch, note off per pitch, time shifts of 1 to
+# TIME_SHIFT_STEPS frames and velocity bins that apply to the next note ons
+TOKEN_NOTE_ON = 0
+TOKEN_NOTE_OFF = 128
+TOKEN_TIME_SHIFT = 256
+TIME_SHIFT_STEPS = 100
+TOKEN_VELOCITY = TOKEN_TIME_SHIFT + TIME_SHIFT_STEPS
+VELOCITY_BINS = 32
+TOKENS_COUNT = TOKEN_VELOCITY + VELOCITY_BINS
+
+def tokenize(compact_midi_file, step=None, seconds=None, channels=None):
+    starts, ends, pitches, velocities = frame_notes(compact_midi_file, step, seconds, channels)
+
+    # note offs sort before note ons in the same frame
+    events = list(zip(ends, itertools.repeat(0), pitches, itertools.repeat(0)))
+    events.extend(zip(starts, itertools.repeat(1), pitches, velocities))
+    events.sort()
+
+    tokens = array.array('H')
+    current_frame = 0
+    current_bin = None
+
+    for frame, note_on, pitch, velocity in events:
+        shift = frame - current_frame
+
+        while shift > 0:
+            tokens.append(TOKEN_TIME_SHIFT + min(shift, TIME_SHIFT_STEPS) - 1)
+            shift -= TIME_SHIFT_STEPS
+
+        current_frame = frame
+
+        if note_on:
+            velocity_bin = velocity * VELOCITY_BINS // 128
+
+            if velocity_bin != current_bin:
+                tokens.append(TOKEN_VELOCITY + velocity_bin)
+                current_bin = velocity_bin
+
+            tokens.append(TOKEN_NOTE_ON + pitch)
+        else:
+            tokens.append(TOKEN_NOTE_OFF + pitch)
+
+    return(tokens)
+
+class MidiSummary():
+    def __init__(self, path=None, file_format=0, tracks_count=0, division=0):
+        self.path = path
+        self.file_format = file_format
+        self.tracks_count = tracks_count
+        self.division = division
+        self.events_count = 0
+        self.notes_count = 0
+        self.duration_ticks = 0
+        self.duration_seconds = 0.0
+
+        # (tick, value) pairs in the order they appear in the tracks
+        self.track_names = []
+        self.tempos = []
+        self.time_signatures = []
+        self.key_signatures = []
+
+    @classmethod
+    def from_compact(cls, compact_midi_file):
+        summary = cls(compact_midi_file.path, compact_midi_file.file_format,
+                      compact_midi_file.tracks_count, compact_midi_file.division)
+
+        for track in compact_midi_file.tracks:
+            summary.events_count += len(track)
+
+            if len(track):
+                summary.duration_ticks = max(summary.duration_ticks, track.ticks[-1])
+
+            for i in range(len(track)):
+                if track.statuses[i] & 0b11110000 == NOTE_ON and track.data2[i] != 0:
+                    summary.notes_count += 1
+                elif track.statuses[i] == 0b11111111 and track.data1[i] in SUMMARY_META_TYPES:
+                    summary.add_meta(track.data1[i], track.ticks[i], track.payload(i))
+
+        summary.finish()
+
+        return(summary)
+
+    def add_meta(self, meta_type, tick, payload):
+        if meta_type == META_TEXT_SEQUENCE_OR_TRACK_NAME:
+            self.track_names.append((tick, str(payload, 'utf-8', 'replace')))
+        elif meta_type == META_TEMPO and len(payload) == 3:
+            self.tempos.append((tick, bytes_to_uint24(payload)))
+        elif meta_type == META_TIME_SIGNATURE and len(payload) >= 2:
+            self.time_signatures.append((tick, (payload[0], 1 << payload[1])))
+        elif meta_type == META_KEY_SIGNATURE and len(payload) >= 2:
+            self.key_signatures.append((tick, (struct.unpack('b', payload[:1])[0], payload[1] == 1)))
+
+    def finish(self):
+        self.duration_seconds = TempoMap(self.division, self.tempos).tick_to_seconds(self.duration_ticks)
+
+    def __repr__(self):
+        return('<Summary: ' + str(self.path) + ', ' +
+               'File format: ' + str(self.file_format) + ', ' +
+               'Tracks count: ' + str(self.tracks_count) + ', ' +
+               'Division: ' + str(self.division) + ', ' +
+               'Events: ' + str(self.events_count) + ', ' +
+               'Notes: ' + str(self.notes_count) + ', ' +
+               'Duration: ' + '%.3f' % self.duration_seconds + '>')
+
+SUMMARY_META_TYPES = frozenset((META_TEXT_SEQUENCE_OR_TRACK_NAME,
+                                META_TEMPO,
+                                META_TIME_SIGNATURE,
+                                META_KEY_SIGNATURE))
+
+# walks the chunks without creating any event objects, channel event data
+# and uninteresting payloads are skipped over, note ons are only counted
+# chunks other than MThd and MTrk are skipped as the standard requires, and
+# fewer than 8 bytes after the last chunk are taken as padding unless they
+# start a MThd or MTrk header
+def scan_summary(byte_list, path=None):
+    byte_list = bytes(byte_list)
+    summary = MidiSummary(path)
+    file_pos = 0
+    chunk_index = 0
+
+    while file_pos + 8 <= len(byte_list):
+        chunk_type = byte_list[file_pos:file_pos + 4]
+        length = bytes_to_uint32(byte_list, file_pos + 4)
+
+        if chunk_type in (b'MThd', b'MTrk') and file_pos + 8 + length > len(byte_list):
+            raise(MidiException('Truncated chunk', file_pos, chunk_index))
+
+        if chunk_type == b'MThd':
+            if length < 6:
+                raise(MidiException('Invalid MThd chunk', file_pos, chunk_index))
+
+            summary.file_format = bytes_to_uint16(byte_list, file_pos + 8)
+            summary.tracks_count = bytes_to_uint16(byte_list, file_pos + 10)
+            summary.division = bytes_to_uint16(byte_list, file_pos + 12)
+        elif chunk_type == b'MTrk':
+            try:
+                scan_track(summary, byte_list, file_pos + 8, file_pos + 8 + length)
+            except MidiException as e:
+                e.chunk_index = chunk_index
+                raise
+
+        file_pos += 8 + length
+        chunk_index += 1
+
+    if byte_list[file_pos:file_pos + 4] in (b'MThd', b'MTrk'):
+        raise(MidiException('Truncated chunk', file_pos, chunk_index))
+
+    summary.finish()
+
+    return(summary)
+
+def scan_track(summary, byte_list, start, end):
+    midi_event_lengths = MIDI_EVENT_LENGTHS
+    tmp_pos = start
+    event_pos = start
+    tick = 0
+    running_status = None
+    events_count = 0
+    notes_count = 0
+
+    try:
+        while tmp_pos < end:
+            event_pos = tmp_pos
+            byte = byte_list[tmp_pos]
+            delta_time = byte & 0b01111111
+            tmp_pos += 1
+
+            while byte & 0b10000000:
+                byte = byte_list[tmp_pos]
+                delta_time = (delta_time << 7) | (byte & 0b01111111)
+                tmp_pos += 1
+
+            tick += delta_time
+            events_count += 1
+
+            status = byte_list[tmp_pos]
+
+            if status < 0b10000000:
+                if running_status is None:
+                    raise(MidiException('No such event', event_pos, None, status))
+
+                status = running_status
+            else:
+                tmp_pos += 1
+
+            length = midi_event_lengths[status]
+
+            if length != 0:
+                if status & 0b11110000 == 0b10010000 and byte_list[tmp_pos + 1] != 0:
+                    notes_count += 1
+
+                tmp_pos += length - 1
+                running_status = status
+            elif status == 0b11111111:
+                meta_type = byte_list[tmp_pos]
+                payload_length, length = decode_variable_length_value(byte_list, tmp_pos + 1)
+                tmp_pos += 1 + length
+
+                if meta_type in SUMMARY_META_TYPES:
+                    summary.add_meta(meta_type, tick, byte_list[tmp_pos:tmp_pos + payload_length])
+
+                tmp_pos += payload_length
+                running_status = None
+
+                if tmp_pos > len(byte_list):
+                    raise(MidiException('Truncated meta event', event_pos, None, status))
+            elif SYSTEM_EVENT_LENGTHS[status] is None:
+                tmp_pos = byte_list.index(b'\xf7', tmp_pos) + 1
+                running_status = None
+            elif SYSTEM_EVENT_LENGTHS[status] != 0:
+                tmp_pos += SYSTEM_EVENT_LENGTHS[status] - 1
+                running_status = None
+            else:
+                raise(MidiException('No such event', event_pos, None, status))
+    except (IndexError, ValueError) as e:
+        # an event or sysex runs past the end of the data
+        raise(event_error(byte_list, event_pos, MidiException('Truncated event'))) from e
+
+    summary.events_count += events_count
+    summary.notes_count += notes_count
+    summary.duration_ticks = max(summary.duration_ticks, tick)
+
+def load_compact(path):
+    try:
+        with open(path, 'rb') as midi_file:
+            return(CompactMidiFile.from_bytes(midi_file.read(), path))
+    except MidiException as e:
+        raise(MidiException('Could not open midi file: ' + e.message,
+                            e.offset, e.chunk_index, e.status)) from e
+    except Exception as e:
+        raise(MidiException('Could not open midi file')) from e
+
+def load_summary(path):
+    try:
+        with open(path, 'rb') as midi_file:
+            return(scan_summary(midi_file.read(), path))
+    except MidiException as e:
+        raise(MidiException('Could not open midi file: ' + e.message,
+                            e.offset, e.chunk_index, e.status)) from e
+    except Exception as e:
+        raise(MidiException('Could not open midi file')) from e
+
+# snapshot layout: header, then per track its counts followed by the raw
+# arrays in native byte order, as written by array.tofile
+SNAPSHOT_MAGIC = b'MPYS'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<4sHBBHHI')
+SNAPSHOT_TRACK_HEADER = struct.Struct('<II')
+SNAPSHOT_ARRAYS = ('delta_times', 'ticks', 'statuses', 'channels', 'data1', 'data2', 'running',
+                   'payload_offsets')
+
+def write_snapshot(compact_midi_file, path):
+    import tempfile
+
+    # a unique temporary file per writer, so concurrent writers of the same
+    # snapshot never mix their data before the rename
+    handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path) or '.')
+
+    try:
+        with os.fdopen(handle, 'wb') as snapshot_file:
+            write_snapshot_data(compact_midi_file, snapshot_file)
+
+        # readers never see a half written snapshot
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+
+        raise
+
+def write_snapshot_data(compact_midi_file, snapshot_file):
+    snapshot_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                             0 if sys.byteorder == 'little' else 1,
+                                             array.array('I').itemsize,
+                                             compact_midi_file.file_format,
+                                             compact_midi_file.division,
+                                             compact_midi_file.tracks_count))
+
+    for track in compact_midi_file.tracks:
+        snapshot_file.write(SNAPSHOT_TRACK_HEADER.pack(len(track), len(track.payloads)))
+
+        for name in SNAPSHOT_ARRAYS:
+            getattr(track, name).tofile(snapshot_file)
+
+        snapshot_file.write(track.payloads)
+
+# the slice of size bytes at offset, a snapshot that ends early is invalid
+def snapshot_slice(view, offset, size):
+    if offset + size > len(view):
+        raise(MidiException('Invalid snapshot'))
+
+    return(view[offset:offset + size])
+
+def read_snapshot(path):
+    with open(path, 'rb') as snapshot_file:
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as snapshot_data:
+            with memoryview(snapshot_data) as view:
+                magic, version, byteorder, itemsize, file_format, division, tracks_count = \
+                    SNAPSHOT_HEADER.unpack(snapshot_slice(view, 0, SNAPSHOT_HEADER.size))
+
+                if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or \
+                   itemsize != array.array('I').itemsize:
+                    raise(MidiException('Invalid snapshot'))
+
+                compact_midi_file = CompactMidiFile(file_format, division)
+                tmp_pos = SNAPSHOT_HEADER.size
+
+                for _ in range(tracks_count):
+                    events_count, payloads_size = SNAPSHOT_TRACK_HEADER.unpack(
+                        snapshot_slice(view, tmp_pos, SNAPSHOT_TRACK_HEADER.size))
+                    tmp_pos += SNAPSHOT_TRACK_HEADER.size
+
+                    track = CompactTrack()
+                    del track.payload_offsets[:]
+
+                    for name in SNAPSHOT_ARRAYS:
+                        column = getattr(track, name)
+                        size = (events_count + (name == 'payload_offsets')) * column.itemsize
+
+                        column.frombytes(snapshot_slice(view, tmp_pos, size))
+                        tmp_pos += size
+
+                        if byteorder != (0 if sys.byteorder == 'little' else 1):
+                            column.byteswap()
+
+                    if track.payload_offsets[-1] != payloads_size:
+                        raise(MidiException('Invalid snapshot'))
+
+                    track.payloads += snapshot_slice(view, tmp_pos, payloads_size)
+                    tmp_pos += payloads_size
+
+                    compact_midi_file.tracks.append(track)
+
+                if tmp_pos != len(view):
+                    raise(MidiException('Invalid snapshot'))
+
+    return(compact_midi_file)
+
+# parsed files keyed by content hash ('hash') or by path, mtime and size
+# ('stat'), in a bounded in memory LRU in front of optional disk snapshots
+class ParseCache():
+    def __init__(self, directory=None, max_entries=128, key='stat'):
+        if key not in ('stat', 'hash'):
+            raise(MidiException('No such cache key type'))
+
+        self.directory = directory
+        self.max_entries = max_entries
+        self.key = key
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = collections.OrderedDict()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return(len(self._entries))
+
+    def __repr__(self):
+        return('<Parse cache Entries: ' + str(len(self._entries)) + ', ' +
+               'Hits: ' + str(self.hits) + ', ' +
+               'Disk hits: ' + str(self.disk_hits) + ', ' +
+               'Misses: ' + str(self.misses) + ', ' +
+               'Evictions: ' + str(self.evictions) + '>')
+
+    def cache_key(self, path):
+        import hashlib
+
+        if self.key == 'hash':
+            with open(path, 'rb') as midi_file:
+                return(hashlib.sha256(midi_file.read()).hexdigest())
+        else:
+            stat = os.stat(path)
+            identity = os.path.abspath(path) + ':' + str(stat.st_mtime_ns) + ':' + str(stat.st_size)
+
+            return(hashlib.sha256(str_to_bytes(identity)).hexdigest())
+
+    # the returned object is shared between callers and must not be modified
+    def load_compact(self, path):
+        try:
+            key = self.cache_key(path)
+        except OSError:
+            raise(MidiException('Could not open midi file'))
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return(self._entries[key])
+
+        compact_midi_file = None
+
+        if self.directory is not None:
+            snapshot_path = os.path.join(self.directory, key + '.mps')
+
+            if os.path.exists(snapshot_path):
+                try:
+                    compact_midi_file = read_snapshot(snapshot_path)
+                    compact_midi_file.path = path
+                    self.disk_hits += 1
+                except (MidiException, struct.error, ValueError):
+                    compact_midi_file = None
+
+        if compact_midi_file is None:
+            self.misses += 1
+            compact_midi_file = load_compact(path)
+
+            if self.directory is not None:
+                write_snapshot(compact_midi_file, snapshot_path)
+
+        self._entries[key] = compact_midi_file
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+        return(compact_midi_file)
+
+    def load(self, path):
+        return(self.load_compact(path).to_midi_file())
+
+    def clear(self):
+        self._entries.clear()
+
+class BatchResult():
+    def __init__(self, path, value=None, error=None):
+        self.path = path
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return(self.error is None)
+
+    def __repr__(self):
+        if self.error is None:
+            return('<Batch result: ' + str(self.path) + ', ' + repr(self.value) + '>')
+        else:
+            return('<Batch result: ' + str(self.path) + ', Error: ' + str(self.error) + '>')
+
+def load_tokens(path):
+    return(tokenize(load_compact(path)))
+
+def load_recovered(path):
+    midi_file = MidiFile(path, recover=True)
+
+    compact_midi_file = CompactMidiFile.from_midi_file(midi_file)
+    compact_midi_file.diagnostics = midi_file.diagnostics
+
+    return(compact_midi_file)
+
+BATCH_LOADERS = {
+    'compact': load_compact,
+    'summary': load_summary,
+    'recovered': load_recovered,
+    'tokens': load_tokens,
+}
+
+def load_batch(paths, result='compact'):
+    loader = BATCH_LOADERS[result]
+    results = []
+
+    for path in paths:
+        # a broken file only fails its own result, never the whole batch
+        try:
+            results.append(BatchResult(path, loader(path)))
+        except MidiException as e:
+            results.append(BatchResult(path, error=e))
+
+    return(results)
+
+def load_many(paths, result='compact', workers=None, chunksize=16, ordered=True):
+    if result not in BATCH_LOADERS:
+        raise(MidiException('No such batch result type'))
+
+    paths = list(paths)
+    batches = [paths[i:i + chunksize] for i in range(0, len(paths), chunksize)]
+
+    if workers == 1:
+        for batch in batches:
+            yield from load_batch(batch, result)
+
+        return
+
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            for results in executor.map(load_batch, batches, [result] * len(batches)):
+                yield from results
+        else:
+            futures = [executor.submit(load_batch, batch, result) for batch in batches]
+
+            for future in concurrent.futures.as_completed(futures):
+                yield from future.result()
+
+# data bytes following each system common status, 0b11110001 (MIDI time
+# code quarter frame) has no event type and is skipped over
+SYSTEM_COMMON_DATA_LENGTHS = {
+    0b11110001: 1,
+    0b11110010: 2,
+    0b11110011: 1,
+    0b11110110: 0,
+}
+
+# push parser for live byte streams, feed() accepts fragments of any size
+# and keeps running status, partial messages and sysex across calls
+class StreamParser():
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.running_status = None
+
+        self._status = None
+        self._expected = 0
+        self._received = 0
+        self._data = [0, 0]
+        self._sysex = bytearray()
+        self._in_sysex = False
+
+    def reset(self):
+        self.running_status = None
+        self._status = None
+        self._expected = 0
+        self._received = 0
+        self._sysex.clear()
+        self._in_sysex = False
+
+    def emit(self, event, events):
+        events.append(event)
+
+        if self.callback is not None:
+            self.callback(event)
+
+    def end_sysex(self, events):
+        self._in_sysex = False
+        self.emit(SystemEvent.from_values(SYSTEM_EXCLUSIVE, bytes(self._sysex)), events)
+        self._sysex.clear()
+
+    def feed(self, byte_list):
+        events = []
+
+        for byte in byte_list:
+            if byte >= 0b11111000:
+                # real time messages may appear anywhere, even inside other messages
+                if byte in SYSTEM_EVENT_TYPES:
+                    self.emit(SystemEvent.from_values(byte), events)
+            elif byte < 0b10000000:
+                if self._in_sysex:
+                    self._sysex.append(byte)
+                elif self._status is not None:
+                    self._data[self._received] = byte
+                    self._received += 1
+
+                    if self._received == self._expected:
+                        self.complete(events)
+            elif byte == SYSTEM_EXCLUSIVE:
+                if self._in_sysex:
+                    self.end_sysex(events)
+
+                self._in_sysex = True
+                self.running_status = None
+                self._status = None
+            elif byte == SYSTEM_COMMON:
+                if self._in_sysex:
+                    self.end_sysex(events)
+
+                # like any system common status, EOX cancels running status
+                self.running_status = None
+                self._status = None
+                self._received = 0
+            else:
+                # any other status ends an unterminated sysex
+                if self._in_sysex:
+                    self.end_sysex(events)
+
+                self._received = 0
+
+                if byte < 0b11110000:
+                    self.running_status = byte
+                    self._status = byte
+                    self._expected = MIDI_EVENT_LENGTHS[byte] - 1
+                elif byte in SYSTEM_COMMON_DATA_LENGTHS:
+                    self.running_status = None
+                    self._status = byte
+                    self._expected = SYSTEM_COMMON_DATA_LENGTHS[byte]
+
+                    if self._expected == 0:
+                        self.complete(events)
+                else:
+                    self.running_status = None
+                    self._status = None
+
+        return(events)
+
+    def complete(self, events):
+        status = self._status
+
+        self._received = 0
+
+        if status < 0b11110000:
+            self.emit(MidiEvent.from_values(status, self._data[0],
+                                            self._data[1] if self._expected == 2 else 0), events)
+        else:
+            if status in SYSTEM_EVENT_TYPES:
+                self.emit(SystemEvent.from_values(status, bytes(self._data[:self._expected])), events)
+
+            # system common messages do not set a running status
+            self._status = None
+
+async def iter_stream_events(reader, parser=None, block_size=1024):
+    if parser is None:
+        parser = StreamParser()
+
+    while True:
+        byte_list = await reader.read(block_size)
+
+        if not byte_list:
+            return
 
+        for event in parser.feed(byte_list):
+            yield(event)